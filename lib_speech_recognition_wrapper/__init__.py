@@ -10,4 +10,45 @@ __maintainer__ = "Justin Furuness"
 __email__ = "jfuruness@gmail.com"
 __status__ = "Development"
 
-from .speech_recognition_wrapper import Speech_Recognition_Wrapper
+import importlib
+
+# Public name -> module it lives in. Imported on first access so that
+# importing the package (or running --help) doesn't load pocketsphinx,
+# PyAudio, NumPy or the tuner toolchain
+_lazy_imports = {"Audio_Source": "audio_sources",
+                 "Bytes_Audio_Source": "audio_sources",
+                 "File_Audio_Source": "audio_sources",
+                 "Microphone_Audio_Source": "audio_sources",
+                 "Audio_Augmenter": "augmentation",
+                 "Batch_Keyword_Spotter": "batch",
+                 "Decoder_Pool": "decoder_pool",
+                 "Model_Evaluator": "evaluation",
+                 "Keyword_Spotter": "keyword_spotter",
+                 "Metrics": "metrics",
+                 "Metrics_Exporter": "metrics",
+                 "Buffered_Audio_Source": "ring_buffer",
+                 "Ring_Buffer": "ring_buffer",
+                 "Cron_Schedule": "scheduler",
+                 "Interval_Schedule": "scheduler",
+                 "One_Shot_Schedule": "scheduler",
+                 "Recognition_Server": "server",
+                 "Speech_Recognition_Wrapper": "speech_recognition_wrapper",
+                 "Threshold_Tuner": "threshold_tuner",
+                 "Energy_VAD": "vad",
+                 "Wav_Writer": "wav_writer"}
+
+__all__ = list(_lazy_imports)
+
+
+def __getattr__(name):
+    if name not in _lazy_imports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_lazy_imports[name]}", __name__)
+    value = getattr(module, name)
+    # Cached so __getattr__ only runs on first access
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -13,10 +13,6 @@ __status__ = "Development"
 from argparse import ArgumentParser
 import logging
 
-from lib_utils import utils
-
-from .speech_recognition_wrapper import Speech_Recognition_Wrapper
-
 
 def main():
     """Does all the command line options available
@@ -24,13 +20,75 @@ def main():
 
     parser = ArgumentParser(description="lib_speech_recognition_wrapper")
 
-    for arg in ["run", "debug", "test"]:
+    for arg in ["run", "debug", "test", "vad"]:
         parser.add_argument(f"--{arg}", default=False, action='store_true')
+    # WAV or raw 16 kHz PCM to decode instead of the mic
+    parser.add_argument("--file", default=None)
+    # compact only loads keyword pronunciations into the decoder
+    parser.add_argument("--dict_mode", default="full",
+                        choices=["full", "compact"])
+    # Dir of wavs or a fileids file to keyword spot in parallel
+    parser.add_argument("--batch", default=None)
+    parser.add_argument("--workers", default=None, type=int)
+    # JSONL output for --batch, kws list for --tune_thresholds
+    parser.add_argument("--output", default=None)
+    # host:port or unix socket path to serve many PCM streams on
+    parser.add_argument("--serve", default=None)
+    # Serves /metrics and /metrics.json on localhost while running
+    parser.add_argument("--metrics_port", default=None, type=int)
+    # Dir of labeled recordings to pick keyword thresholds from
+    parser.add_argument("--tune_thresholds", default=None)
+    # Highest false alarms per hour --tune_thresholds may pick
+    parser.add_argument("--max_false_alarms", default=1.0, type=float)
+    # kws list ("GO TO SCHOOL /1e-10/" lines) reloaded on edits with --run
+    parser.add_argument("--watch_keywords", default=None)
 
     args = parser.parse_args()
 
+    # Imported after parsing so that --help doesn't load them
+    from lib_utils import utils
+
     # Configure logging
     utils.config_logging(logging.DEBUG if args.debug else logging.INFO, "speech")
 
     if args.run:
-        Speech_Recognition_Wrapper(test=args.test).run()
+        from .audio_sources import File_Audio_Source
+        from .speech_recognition_wrapper import Speech_Recognition_Wrapper
+
+        audio_source = None
+        if args.file:
+            audio_source = File_Audio_Source(args.file)
+        wrapper = Speech_Recognition_Wrapper(test=args.test,
+                                             dict_mode=args.dict_mode,
+                                             vad=args.vad,
+                                             metrics_port=args.metrics_port)
+        if args.watch_keywords:
+            wrapper.watch_keywords(args.watch_keywords)
+        wrapper.run(audio_source)
+    elif args.batch:
+        from .batch import Batch_Keyword_Spotter
+
+        spotter = Batch_Keyword_Spotter(workers=args.workers,
+                                        dict_mode=args.dict_mode)
+        if args.output:
+            with open(args.output, "w") as f:
+                spotter.run(args.batch, f)
+        else:
+            spotter.run(args.batch)
+    elif args.tune_thresholds:
+        from .threshold_tuner import Threshold_Tuner
+
+        tuner = Threshold_Tuner(audio_path=args.tune_thresholds,
+                                max_false_alarms_per_hour=args.max_false_alarms,
+                                workers=args.workers,
+                                dict_mode=args.dict_mode)
+        tuner.run(args.output)
+    elif args.serve:
+        from .server import Recognition_Server
+
+        Recognition_Server(workers=args.workers,
+                           dict_mode=args.dict_mode).run(args.serve)
+
+
+if __name__ == "__main__":
+    main()
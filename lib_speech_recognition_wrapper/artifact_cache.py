@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+
+class Artifact_Cache:
+    """Downloaded and built artifacts, reused across tuning runs
+
+    Each artifact is a directory named by a hash of what it was made
+    from (a URL, or a repo and commit). The checksums of its outputs,
+    every file but .git by default, are written last, so they double as
+    the completion marker: entries without them, or whose outputs no
+    longer match, are rebuilt instead of used. Files added since, like
+    those make install or libtool wrappers leave behind, don't count.
+    Builds happen in place since autotools builds hardcode their own
+    path"""
+
+    checksums_name = ".checksums.json"
+
+    def __init__(self, cache_dir="/var/cache/lib_speech_recognition_wrapper"):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+    def get(self, name, *parts, build, outputs=None):
+        """Returns the artifact's dir, calling build(path) on a miss
+
+        outputs are the paths relative to it that are checksummed"""
+
+        path = self.path(name, *parts)
+        if os.path.exists(os.path.join(path, self.checksums_name)):
+            if self.verify(path):
+                self.hits += 1
+                logging.info(f"Using cached {name} from {path}")
+                return path
+            logging.warning(f"{path} failed its checksums, rebuilding")
+        self.misses += 1
+        if os.path.lexists(path):
+            # Not ignoring errors, files a sudo make install left behind
+            # would otherwise fail the build later and less clearly
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+        build(path)
+        if outputs is None:
+            files = self.checksums(path)
+        else:
+            files = {x: self.checksum(os.path.join(path, x)) for x in outputs}
+        checksums = {"parts": list(parts), "files": files}
+        tmp_path = os.path.join(path, self.checksums_name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(checksums, f, indent=4)
+        os.replace(tmp_path, os.path.join(path, self.checksums_name))
+        return path
+
+    def has(self, name, *parts):
+        """True if the artifact was built, without verifying it"""
+
+        return os.path.exists(os.path.join(self.path(name, *parts),
+                                           self.checksums_name))
+
+    def path(self, name, *parts):
+        return os.path.join(self.cache_dir, f"{name}-{self.key(*parts)}")
+
+    def verify(self, path):
+        return self.matches(path, path)
+
+    def matches(self, path, target):
+        """True if target holds every file of the artifact at path
+
+        Used to verify an artifact against itself, and to skip copying
+        one that's already in place"""
+
+        with open(os.path.join(path, self.checksums_name), "r") as f:
+            files = json.load(f)["files"]
+        for rel_path, checksum in files.items():
+            target_path = os.path.join(target, rel_path)
+            if (not os.path.lexists(target_path)
+                    or self.checksum(target_path) != checksum):
+                return False
+        return True
+
+    def checksums(self, path):
+        """Relative path -> checksum of every file under path but .git"""
+
+        checksums = dict()
+        for dirpath, dirnames, filenames in os.walk(path):
+            if ".git" in dirnames:
+                dirnames.remove(".git")
+            for fname in filenames:
+                if fname.startswith(self.checksums_name):
+                    continue
+                file_path = os.path.join(dirpath, fname)
+                checksums[os.path.relpath(file_path, path)] = \
+                    self.checksum(file_path)
+        return checksums
+
+    @staticmethod
+    def checksum(path):
+        # Build trees have symlinks, some dangling, so don't follow them
+        if os.path.islink(path):
+            return "link:" + os.readlink(path)
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
@@ -0,0 +1,157 @@
+import os
+import sys
+import wave
+
+
+class Audio_Source:
+    """Base class for anything run_decoder can pull audio from
+
+    Audio is always 16 kHz, mono, 16 bit little endian PCM, which is
+    what the decoder config expects. read returns b"" once exhausted"""
+
+    sample_rate = 16000
+    sample_width = 2
+    channels = 1
+    # Frames per read
+    chunk_size = 1024
+
+    def read(self, num_frames):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            buf = self.read(self.chunk_size)
+            if not buf:
+                break
+            yield buf
+
+
+class Microphone_Audio_Source(Audio_Source):
+    """Live PyAudio input. Reads are paced by the sound card"""
+
+    def __init__(self, chunk_size=1024):
+        self.chunk_size = chunk_size
+        self.stream, self.p = self.open_stream(chunk_size)
+
+    @staticmethod
+    def open_stream(chunk_size):
+        # Lazy so that file/bytes sources work without portaudio
+        import pyaudio
+
+        # https://github.com/spatialaudio/python-sounddevice/
+        # issues/11#issuecomment-155836787
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        old_stderr = os.dup(2)
+        sys.stderr.flush()
+        os.dup2(devnull, 2)
+        os.close(devnull)
+        try:
+            p = pyaudio.PyAudio()
+            stream = p.open(format=pyaudio.paInt16,
+                            channels=1,
+                            rate=Audio_Source.sample_rate,
+                            input=True,
+                            frames_per_buffer=chunk_size)
+            stream.start_stream()
+        finally:
+            os.dup2(old_stderr, 2)
+            os.close(old_stderr)
+        print("stream started")
+        return stream, p
+
+    def read(self, num_frames):
+        return self.stream.read(num_frames)
+
+    def close(self):
+        self.stream.close()
+        self.p.terminate()
+
+
+class File_Audio_Source(Audio_Source):
+    """Reads a WAV or headerless PCM file as fast as the decoder can eat it
+
+    Raw files are assumed to already be 16 kHz mono int16. Larger chunks
+    are used than for the mic since nobody is waiting on latency"""
+
+    def __init__(self, path, chunk_size=4096, raw=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        if raw is None:
+            raw = not path.lower().endswith(".wav")
+        self.raw = raw
+        if raw:
+            self._wav = None
+            self._f = open(path, "rb")
+        else:
+            self._f = None
+            self._wav = wave.open(path, "rb")
+            self.check_format(self._wav)
+
+    def check_format(self, wav):
+        fmt = (wav.getframerate(), wav.getnchannels(), wav.getsampwidth())
+        expected = (self.sample_rate, self.channels, self.sample_width)
+        if fmt != expected:
+            self.close()
+            raise ValueError(f"{self.path} is (rate, channels, width) {fmt}, "
+                             f"must be {expected}")
+
+    @property
+    def duration(self):
+        """Length of the audio in seconds"""
+
+        if self.raw:
+            num_bytes = os.path.getsize(self.path)
+            return num_bytes / (self.sample_rate * self.sample_width)
+        return self._wav.getnframes() / self.sample_rate
+
+    def read(self, num_frames):
+        if self.raw:
+            return self._f.read(num_frames * self.sample_width)
+        return self._wav.readframes(num_frames)
+
+    def close(self):
+        for f in (self._f, self._wav):
+            if f is not None:
+                f.close()
+
+
+class Bytes_Audio_Source(Audio_Source):
+    """In memory PCM, either one bytes-like object or an iterator of them
+
+    Iterator chunks don't need to line up with read sizes"""
+
+    def __init__(self, data, chunk_size=4096):
+        self.chunk_size = chunk_size
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = [bytes(data)]
+        self._chunks = iter(data)
+        # Memoryview so slicing a large buffer doesn't copy the remainder
+        self._pending = memoryview(b"")
+
+    def read(self, num_frames):
+        num_bytes = num_frames * self.sample_width
+        if len(self._pending) >= num_bytes:
+            buf = self._pending[:num_bytes]
+            self._pending = self._pending[num_bytes:]
+            return bytes(buf)
+
+        parts = [bytes(self._pending)]
+        have = len(parts[0])
+        while have < num_bytes:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            have += len(chunk)
+        joined = memoryview(b"".join(parts))
+        self._pending = joined[num_bytes:]
+        return bytes(joined[:num_bytes])
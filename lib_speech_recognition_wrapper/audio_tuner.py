@@ -1,78 +1,261 @@
 from datetime import datetime
+import hashlib
+import json
 import re
 import os
 import logging
+import subprocess
 from multiprocessing import Manager, cpu_count
 from random import shuffle
 
 from pathos.multiprocessing import ProcessPool
 from pocketsphinx import get_model_path
-import pyaudio
 import tarfile
-from shutil import copyfile
-import wave
+from shutil import copy2, copyfile, copytree, which
 
 from lib_utils.helper_funcs import Pool, run_cmds
 from lib_utils.print_funcs import write_to_stdout
 from lib_utils.file_funcs import makedirs, delete_paths, download_file
 
+from . import defaults
 from . import speech_recognition_wrapper as sr
+from .artifact_cache import Artifact_Cache
+from .augmentation import Audio_Augmenter
+from .evaluation import Model_Evaluator
+from .pipeline import Pipeline, Stage
+from .wav_writer import Wav_Writer
 
-tuned_path = "/etc/tuned/"
 
 class Audio_Tuner:
 
-    tuned_path = "/etc/tuned"
+    tuned_path = defaults.tuned_path
     audio_path  ="/etc/audio"
     transcription_name = "assistant.transcription"
     file_ids_name = "assistant.fileids"
-    test_transcription_name = "test.transcription"
-    test_file_ids_name = "test.fileids"
+    shards_dir_name = "shards"
+    mfcc_cache_dir_name = "mfcc_cache"
+    accum_dir_name = "accum"
+    manifest_name = "accum_manifest.json"
+    stages_dir_name = ".stages"
+    session_name = "session.json"
+    en_us_url = ("https://phoenixnap.dl.sourceforge.net/project/cmusphinx/"
+                 "Acoustic%20and%20Language%20Models/US%20English/"
+                 "cmusphinx-en-us-5.2.tar.gz")
+    # name: (url, ref), builds are cached per url and the commit the ref
+    # pointed at when first built, see pinned_repo
+    sphinx_repos = {
+        "sphinxbase": ("https://github.com/cmusphinx/sphinxbase.git", "master"),
+        "pocketsphinx": ("git@github.com:cmusphinx/pocketsphinx.git", "master"),
+        "sphinxtrain": ("git@github.com:cmusphinx/sphinxtrain.git", "master")}
+    # Build outputs the artifact cache checksums, relative to its dir.
+    # Not the whole tree, which make install and libtool wrappers change
+    sphinx_outputs = {
+        "sphinxbase": ["sphinxbase/src/libsphinxbase/libsphinxbase.la",
+                       "sphinxbase/src/sphinx_fe/sphinx_fe"],
+        "pocketsphinx": [
+            "pocketsphinx/src/libpocketsphinx/libpocketsphinx.la",
+            "pocketsphinx/src/programs/pocketsphinx_mdef_convert"],
+        "sphinxtrain": ["sphinxtrain/src/programs/bw/bw",
+                        "sphinxtrain/src/programs/map_adapt/map_adapt"]}
+    pins_name = "pins.json"
+
+    def __init__(self,
+                 tuning_phrases: list,
+                 times_to_record=1,
+                 test=False,
+                 workers=None,
+                 artifact_cache=None,
+                 trim_silence=True,
+                 augmenter=None):
+        """tuning phrases to be tuned to
+
+        sphinx_fe and bw run over shards of the fileids on workers
+        processes, all cores by default. Features and bw counts are
+        kept in tuned_path, so later runs only process new recordings.
+        The model download and sphinx builds are kept in artifact_cache,
+        so later runs don't need the network. trim_silence cuts the
+        silence before and after each recorded phrase. augmenter makes
+        extra training copies of the recordings, Audio_Augmenter() by
+        default, False for none"""
 
-    def __init__(self, tuning_phrases: list, times_to_record=1, test=False):
-        """tuning phrases to be tuned to"""
-
-        self.session_id = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
         self.username = input("User name: ").lower()
-        self.session_id += f"_{self.username}_"
         self.model_path = get_model_path()
         self.tuning_phrases = tuning_phrases * times_to_record
         if test:
             shuffle(self.tuning_phrases)
             self.tuning_phrases = self.tuning_phrases[:1]
+        self.session_id = self.resumed_session_id() or self.new_session_id()
         # model path for pocket sphinx
         self.model_path = get_model_path()
-
-    def run(self):
-        run_cmds("sudo apt -y install pocketsphinx")
-        self.generate_new_model()
+        self.workers = workers or cpu_count()
+        self.artifact_cache = artifact_cache or Artifact_Cache()
+        self.build_deps_installed = False
+        self.trim_silence = trim_silence
+        if augmenter is None:
+            augmenter = Audio_Augmenter(workers=self.workers)
+        self.augmenter = augmenter
+
+    def run(self, rerun=()):
+        if which("pocketsphinx_continuous") is None:
+            run_cmds("sudo apt -y install pocketsphinx")
+        self.generate_new_model(rerun=rerun)
         self.test_new_model()
         input("backup audio in /etc/audio then press enter")
 
-    def generate_new_model(self):
-        for func in [self.make_file_dirs,
-                     self.record_files,
-                     self.copy_files,
-                     self.install_sphinx_base,
-                     self.run_sphinx_fe,
-                     self.download_proper_en,
-                     self.convert_mdef,
-                     self.download_sphinxtrain,
-                     self.run_bw,
-                     # self.run_mllr,
-                     self.run_adapt]:
-            logging.info(f"In {func.__name__}")
-            func()
-
-    def test_new_model(self):
-        self.write_test_files()
-        self.run_test_decoder()
+    def generate_new_model(self, rerun=()):
+        """Runs the stale stages of the pipeline, and those in rerun
+
+        Resumes after the last stage that finished, so a failure in
+        run_adapt doesn't mean recording everything again, even from a
+        new Audio_Tuner. The session is kept until the pipeline
+        finishes, after which the next Audio_Tuner records again, as
+        does rerunning record_files. The toolchain builds and model
+        download run while recording is in progress, so everything
+        needing sudo happens first"""
+
+        if "record_files" in rerun:
+            self.session_id = self.new_session_id()
+        self.install_sudo_deps()
+        self.write_session()
+        self.pipeline.run(rerun=rerun)
+        os.remove(self.session_path)
+
+    def new_session_id(self):
+        now = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        return f"{now}_{self.username}_"
+
+    def resumed_session_id(self):
+        """The session of an unfinished run by this user of these phrases"""
+
+        try:
+            with open(self.session_path, "r") as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (session.get("username") != self.username
+                or session.get("tuning_phrases") != self.tuning_phrases):
+            return None
+        logging.info(f"Resuming session {session['session_id']}")
+        return session["session_id"]
+
+    def write_session(self):
+        os.makedirs(os.path.dirname(self.session_path), exist_ok=True)
+        tmp_path = self.session_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"session_id": self.session_id,
+                       "username": self.username,
+                       "tuning_phrases": self.tuning_phrases}, f, indent=4)
+        os.replace(tmp_path, self.session_path)
+
+    @property
+    def pipeline(self):
+        tuned = lambda *x: os.path.join(self.tuned_path, *x)
+        stages = [
+            Stage(self.make_file_dirs,
+                  outputs=[self.tuned_path, self.audio_path]),
+            Stage(self.record_files,
+                  deps=["make_file_dirs"],
+                  params=[self.session_id, self.tuning_phrases],
+                  outputs=[self.audio_file_ids_path,
+                           self.audio_transcription_path]),
+            Stage(self.augment_files,
+                  deps=["record_files"],
+                  params=[self.augmenter and self.augmenter.params],
+                  inputs=[self.audio_file_ids_path,
+                          self.audio_transcription_path],
+                  outputs=[self.augmented_path]),
+            Stage(self.copy_files,
+                  deps=["record_files", "augment_files"],
+                  inputs=[self.audio_path],
+                  outputs=[self.file_ids_path, self.transcription_path]),
+            Stage(self.install_sphinx_base,
+                  deps=["make_file_dirs"],
+                  params=[self.pinned_repo("sphinxbase")],
+                  outputs=[tuned("sphinxbase"), tuned("sphinx_fe")]),
+            Stage(self.download_proper_en,
+                  deps=["copy_files"],
+                  params=[self.en_us_url],
+                  outputs=[tuned("en-us", "means")]),
+            Stage(self.convert_mdef,
+                  deps=["download_proper_en", "install_sphinx_base"],
+                  params=[self.pinned_repo("pocketsphinx")],
+                  inputs=[tuned("en-us", "mdef")],
+                  outputs=[tuned("pocketsphinx"),
+                           tuned("en-us", "mdef.txt")]),
+            Stage(self.download_sphinxtrain,
+                  deps=["install_sphinx_base"],
+                  params=[self.pinned_repo("sphinxtrain")],
+                  outputs=[tuned("sphinxtrain"),
+                           tuned("bw"),
+                           tuned("map_adapt")]),
+            # After the download so features match the model bw adapts
+            Stage(self.run_sphinx_fe,
+                  deps=["copy_files",
+                        "install_sphinx_base",
+                        "download_proper_en"],
+                  inputs=[self.file_ids_path, tuned("en-us", "feat.params")],
+                  outputs=[tuned(self.mfcc_cache_dir_name)]),
+            Stage(self.run_bw,
+                  deps=["run_sphinx_fe",
+                        "convert_mdef",
+                        "download_sphinxtrain"],
+                  inputs=[self.file_ids_path,
+                          self.transcription_path,
+                          tuned("en-us"),
+                          tuned("cmudict-en-us.dict")],
+                  outputs=[self.manifest_path]),
+            Stage(self.run_adapt,
+                  deps=["run_bw"],
+                  inputs=[self.manifest_path],
+                  outputs=[tuned("en-us-adapt", "means")])]
+        return Pipeline(stages, tuned(self.stages_dir_name))
+
+    def test_new_model(self,
+                       fileids_path=None,
+                       transcription_path=None,
+                       kws_thresholds=(-20, -10, -1)):
+        """Compares the baseline and adapted models, returns the report
+
+        Scores the original recordings in audio_path, never their
+        augmented copies, unless a held out fileids_path is given with
+        its wavs next to it. Its transcription_path defaults to the
+        tuned one. The adapted model is also scored as a keyword spotter
+        of the tuning phrases at each of kws_thresholds"""
+
+        makedirs(self.test_dir, remake=True)
+        hmm = lambda x: {"-hmm": os.path.join(self.tuned_path, x),
+                         "-dict": os.path.join(self.tuned_path,
+                                               "cmudict-en-us.dict")}
+        lm = os.path.join(self.tuned_path, "en-us.lm.bin")
+        configs = {"baseline": {**hmm("en-us"), "-lm": lm},
+                   "adapted": {**hmm("en-us-adapt"), "-lm": lm}}
+        for threshold in kws_thresholds:
+            kws_path = os.path.join(self.test_dir, f"kws_1e{threshold}.list")
+            with open(kws_path, "w") as f:
+                for phrase in dict.fromkeys(self.tuning_phrases):
+                    f.write(f"{phrase.upper()} /1e{threshold}/\n")
+            configs[f"adapted_kws_1e{threshold}"] = {**hmm("en-us-adapt"),
+                                                    "-kws": kws_path}
+        if fileids_path is None:
+            fileids_path = self.audio_file_ids_path
+            transcription_path = self.audio_transcription_path
+        evaluator = Model_Evaluator(configs,
+                                    fileids_path,
+                                    transcription_path
+                                    or self.transcription_path,
+                                    workers=self.workers)
+        report = evaluator.run()
+        logging.info("\n" + evaluator.format_report(report))
+        with open(os.path.join(self.test_dir, "report.json"), "w") as f:
+            json.dump(report, f, indent=4)
+        return report
 
     def make_file_dirs(self):
-        delete_paths(self.tuned_path)
-        makedirs(self.tuned_path)
-        if not os.path.exists(self.audio_path):
-            makedirs(self.audio_path)
+        # tuned_path is kept between runs so that only new recordings
+        # get features extracted and accumulated
+        for path in [self.tuned_path, self.audio_path]:
+            if not os.path.exists(path):
+                makedirs(path)
 
     def record_files(self):
         phrase_fnames = list(self.phrase_iter())
@@ -87,72 +270,325 @@ class Audio_Tuner:
                     print(f"{i + 1}/{len(phrase_fnames)} complete")
         input(f"check wave files in {self.audio_path}, then hit enter")
 
+    def augment_files(self):
+        os.makedirs(self.augmented_path, exist_ok=True)
+        if self.augmenter:
+            self.augmenter.run(self.audio_file_ids_path,
+                               self.audio_transcription_path,
+                               self.augmented_path)
+
     def copy_files(self):
-        run_cmds(f"cd {self.audio_path} && cp -R * {self.tuned_path}")
+        """Copies recordings that are new or changed since the last run
+
+        Augmented copies go next to the recordings, with their fileids
+        and transcription entries added to the recordings' ones"""
+
+        audio_dirs = [self.audio_path]
+        if self.augmenter and os.path.exists(self.augmented_path):
+            audio_dirs.append(self.augmented_path)
+        for audio_dir in audio_dirs:
+            for fname in os.listdir(audio_dir):
+                # The augmented fileids and transcription are merged below
+                if audio_dir != self.audio_path and not fname.endswith(".wav"):
+                    continue
+                src = os.path.join(audio_dir, fname)
+                dest = os.path.join(self.tuned_path, fname)
+                if os.path.isfile(src) and not self.same_file(src, dest):
+                    copy2(src, dest)
+        for name, path in [(self.file_ids_name, self.file_ids_path),
+                           (self.transcription_name, self.transcription_path)]:
+            augmented = os.path.join(self.augmented_path, name)
+            if self.augmenter and os.path.exists(augmented):
+                self.merge_lines(os.path.join(self.audio_path, name),
+                                 augmented,
+                                 path)
         # Using bash instead of python to closely follow directions on
         # https://cmusphinx.github.io/wiki/tutorialadapt/
         for _dir in ["en-us",
                      "cmudict-en-us.dict",
                      "en-us.lm.bin"]:
             path = os.path.join(self.model_path, _dir)
-            run_cmds(f"cp -a {path} {self.tuned_path}")
+            # Already replaced by the larger model on earlier runs
+            if not os.path.exists(os.path.join(self.tuned_path, _dir)):
+                run_cmds(f"cp -a {path} {self.tuned_path}")
+
+    @staticmethod
+    def merge_lines(path, extra_path, dest):
+        """Writes the lines of path then those of extra_path to dest, once each"""
+
+        lines = []
+        for _path in [path, extra_path]:
+            if os.path.exists(_path):
+                with open(_path, "r") as f:
+                    lines.extend(x.rstrip("\n") for x in f if x.strip())
+        with open(dest, "w") as f:
+            f.writelines(x + "\n" for x in dict.fromkeys(lines))
+
+    @staticmethod
+    def same_file(src, dest):
+        """copy2 keeps mtimes, so size and mtime spot changed recordings"""
+
+        if not os.path.exists(dest):
+            return False
+        src_stat, dest_stat = os.stat(src), os.stat(dest)
+        return (src_stat.st_size == dest_stat.st_size
+                and src_stat.st_mtime_ns == dest_stat.st_mtime_ns)
 
     def install_sphinx_base(self):
         # https://bangladroid.wordpress.com/2017/02/16/installing-cmu-sphinx-on-ubuntu/
+        path = self.built_repo("sphinxbase")
+        self.make_install(path, "/usr/local/bin/sphinx_fe")
+        copy2("/usr/local/bin/sphinx_fe", self.tuned_path)
+
+    def built_repo(self, name):
+        """Clones and builds a sphinx repo, once per repo url and ref
+
+        Returns the source dir, also linked to from tuned_path since
+        the test stages run tools and scripts out of it"""
+
+        url, commit = self.pinned_repo(name)
+
+        def build(path):
+            self.install_build_deps()
+            # No stdout, this runs while recording prompts are up
+            run_cmds([f"cd {path}",
+                      f"git clone {url} {name}",
+                      f"cd {name}",
+                      f"git checkout {commit}",
+                      "./autogen.sh",
+                      f"make -j {cpu_count()}"])
+
+        path = os.path.join(self.artifact_cache.get(
+                                name,
+                                url,
+                                commit,
+                                build=build,
+                                outputs=self.sphinx_outputs[name]),
+                            name)
+        link = os.path.join(self.tuned_path, name)
+        if os.path.islink(link):
+            os.remove(link)
+        elif os.path.exists(link):
+            delete_paths(link)
+        os.symlink(path, link)
+        return path
+
+    def pinned_repo(self, name):
+        """(url, commit) of a sphinx repo, its ref resolved only once
+
+        A branch moves, so the commit it pointed at the first time is
+        kept next to the builds, and later runs reuse that build
+        without the network. Delete the pin to build the new head"""
+
+        url, ref = self.sphinx_repos[name]
+        if re.fullmatch("[0-9a-f]{40}", ref):
+            return url, ref
+        pins_path = os.path.join(self.artifact_cache.cache_dir,
+                                 self.pins_name)
+        try:
+            with open(pins_path, "r") as f:
+                pins = json.load(f)
+        except (OSError, ValueError):
+            pins = dict()
+        pin_key = f"{url} {ref}"
+        if pin_key not in pins:
+            out = subprocess.check_output(["git", "ls-remote", url, ref],
+                                          text=True)
+            if not out.strip():
+                raise ValueError(f"{ref} not found in {url}")
+            pins[pin_key] = out.split()[0]
+            logging.info(f"Pinned {name} {ref} to {pins[pin_key]}")
+            os.makedirs(self.artifact_cache.cache_dir, exist_ok=True)
+            tmp_path = pins_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(pins, f, indent=4)
+            os.replace(tmp_path, pins_path)
+        return url, pins[pin_key]
+
+    def install_sudo_deps(self):
+        """Does the steps needing a sudo password before recording
+
+        Otherwise password prompts fight the recording prompts for the
+        terminal. Credentials are cached for the make installs, which
+        fail rather than prompt if they've expired by then"""
+
+        if any(not self.artifact_cache.has(name, *self.pinned_repo(name))
+               for name in self.sphinx_repos):
+            self.install_build_deps()
+        run_cmds("sudo -v")
+
+    def install_build_deps(self):
+        if self.build_deps_installed:
+            return
         run_cmds("sudo apt-get install -y gcc automake autoconf libtool "
                        "bison swig python-dev libpulse-dev")
-        sphinx_path = os.path.join(self.tuned_path, "sphinx-src")
-        makedirs(sphinx_path, remake=True)
-        url = "https://github.com/cmusphinx/sphinxbase.git"
-        # sudo is used on the first command to ensure it's use
-        run_cmds([f"sudo ls ",
-                        f"cd {sphinx_path}",
-                        f"git clone {url}",
-                        "cd sphinxbase",
-                        "./autogen.sh",
-                        f"make -j {cpu_count()}",
-                        "sudo make install",
-                        f"cp src/sphinx_fe/sphinx_fe {self.tuned_path}"],
-                        stdout=True)
+        self.build_deps_installed = True
+
+    def make_install(self, path, installed_path):
+        """Installs a cached build, skipped if it's already installed"""
+
+        if os.path.exists(installed_path):
+            return
+        # -n since this runs while recording, see install_sudo_deps
+        run_cmds([f"cd {path}", "sudo -n make install"])
 
     def run_sphinx_fe(self):
+        """Extracts features only for recordings not in the MFCC cache
+
+        The cache is keyed by the wav's sha256 and feat.params, so
+        renamed or re-tuned recordings aren't extracted again"""
+
+        file_ids = self.read_file_ids()
+        self.hash_wavs(file_ids)
+        # feat.params changes the features, so it's part of the key
+        params_hash = self.sha256(os.path.join(self.tuned_path,
+                                               "en-us",
+                                               "feat.params"))
+        self.mfcc_cache_dir = os.path.join(self.tuned_path,
+                                           self.mfcc_cache_dir_name,
+                                           params_hash[:16])
+        if not os.path.exists(self.mfcc_cache_dir):
+            makedirs(self.mfcc_cache_dir)
+        missing = [x for x in file_ids
+                   if not os.path.exists(self.cached_mfcc_path(x))]
+        logging.info(f"Extracting features for {len(missing)}/"
+                     f"{len(file_ids)} recordings")
+        if missing:
+            shards_dir = os.path.join(self.tuned_path,
+                                      self.shards_dir_name,
+                                      "sphinx_fe")
+            shards = self.write_shards(missing, shards_dir)
+            self.map_shards(self.run_sphinx_fe_shard, shards)
+            for file_id in missing:
+                # Rename so a killed run never leaves half a cache entry
+                tmp_path = self.cached_mfcc_path(file_id) + ".tmp"
+                copyfile(self.mfcc_path(file_id), tmp_path)
+                os.replace(tmp_path, self.cached_mfcc_path(file_id))
+        for file_id in file_ids:
+            if file_id not in missing:
+                copyfile(self.cached_mfcc_path(file_id), self.mfcc_path(file_id))
+
+    def run_sphinx_fe_shard(self, shard):
         run_cmds([f"cd {self.tuned_path}",
                        (f"sphinx_fe -argfile en-us/feat.params "
-                        f"-samprate 16000 -c {self.file_ids_path} "
+                        f"-samprate 16000 -c {shard}.fileids "
                         "-di . -do . -ei wav -eo mfc -mswav yes")],
                        stdout=True)
 
-    def download_proper_en(self):
+    def write_shards(self, file_ids, shards_dir):
+        """Splits file_ids and their transcriptions into one shard per worker
+
+        Round robin so that shards get a similar amount of audio.
+        Returns the path of each shard without an extension"""
+
+        transcriptions = dict()
+        with open(self.transcription_path, "r") as f:
+            for line in f:
+                fname = re.findall(r"\(([^()]*)\)\s*$", line)
+                if fname:
+                    transcriptions[fname[0]] = line.rstrip("\n")
+        makedirs(shards_dir, remake=True)
+        num_shards = max(min(self.workers, len(file_ids)), 1)
+        shards = []
+        for i in range(num_shards):
+            shard = os.path.join(shards_dir, f"shard_{i}")
+            shard_ids = file_ids[i::num_shards]
+            with open(shard + ".fileids", "w") as f:
+                f.writelines(x + "\n" for x in shard_ids)
+            with open(shard + ".transcription", "w") as f:
+                f.writelines(transcriptions[x] + "\n" for x in shard_ids)
+            shards.append(shard)
+        return shards
+
+    def map_shards(self, func, shards):
+        if len(shards) == 1:
+            return [func(shards[0])]
+        pool = ProcessPool(nodes=len(shards))
+        try:
+            return pool.map(func, shards)
+        finally:
+            pool.close()
+            pool.join()
+            pool.clear()
+
+    def hash_wavs(self, file_ids):
+        self.wav_hashes = {x: self.sha256(os.path.join(self.tuned_path,
+                                                       x + ".wav"))
+                           for x in file_ids}
+
+    def read_file_ids(self):
+        with open(self.file_ids_path, "r") as f:
+            # dict.fromkeys drops phrases recorded into the list twice
+            return list(dict.fromkeys(x.strip() for x in f if x.strip()))
+
+    @staticmethod
+    def sha256(path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def model_fingerprint(self):
+        """Hash of what bw accumulates against, the model and the dict"""
+
+        sha = hashlib.sha256()
+        model_dir = os.path.join(self.tuned_path, "en-us")
+        for dirpath, dirnames, filenames in sorted(os.walk(model_dir)):
+            for fname in sorted(filenames):
+                path = os.path.join(dirpath, fname)
+                sha.update(os.path.relpath(path, model_dir).encode())
+                sha.update(self.sha256(path).encode())
+        sha.update(self.sha256(os.path.join(self.tuned_path,
+                                            "cmudict-en-us.dict")).encode())
+        return sha.hexdigest()
+
+    def mfcc_path(self, file_id):
+        return os.path.join(self.tuned_path, file_id + ".mfc")
+
+    def cached_mfcc_path(self, file_id):
+        return os.path.join(self.mfcc_cache_dir,
+                            self.wav_hashes[file_id] + ".mfc")
 
-        url = ("https://phoenixnap.dl.sourceforge.net/project/cmusphinx/"
-               "Acoustic%20and%20Language%20Models/US%20English/"
-               "cmusphinx-en-us-5.2.tar.gz")
-        path = os.path.join(self.tuned_path, "larger_sphinx.tar.gz")
+    def download_proper_en(self):
+        """Copies the larger model into tuned_path, downloading it once"""
+
+        path = self.artifact_cache.get("cmusphinx-en-us-5.2",
+                                       self.en_us_url,
+                                       build=self.extract_en_us)
+        if self.artifact_cache.matches(path, self.tuned_path):
+            logging.info("en-us is already the larger model")
+            return
+        en_us_path = os.path.join(self.tuned_path, "en-us")
+        delete_paths(en_us_path)
+        copytree(os.path.join(path, "en-us"), en_us_path, symlinks=True)
+
+    def extract_en_us(self, path):
+        tar_path = os.path.join(path, "larger_sphinx.tar.gz")
         logging.info("downloading file, this may take a while")
-        download_file(url, path)
-        logging.info("downloaded")
-        with tarfile.open(path) as f:
-            old_en_us_path = os.path.join(self.tuned_path, "en-us")
-            delete_paths(old_en_us_path)
+        download_file(self.en_us_url, tar_path)
+        logging.info(f"downloaded, sha256 {Artifact_Cache.checksum(tar_path)}")
+        with tarfile.open(tar_path) as f:
+            old_en_us_path = os.path.join(path, "en-us")
             def is_within_directory(directory, target):
-                
+            
                 abs_directory = os.path.abspath(directory)
                 abs_target = os.path.abspath(target)
-            
+        
                 prefix = os.path.commonprefix([abs_directory, abs_target])
-                
-                return prefix == abs_directory
             
+                return prefix == abs_directory
+        
             def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-            
+        
                 for member in tar.getmembers():
                     member_path = os.path.join(path, member.name)
                     if not is_within_directory(path, member_path):
                         raise Exception("Attempted Path Traversal in Tar File")
-            
+        
                 tar.extractall(path, members, numeric_owner=numeric_owner) 
-                
             
+        
             safe_extract(f, old_en_us_path)
             run_cmds([f"cd {old_en_us_path}",
                             f"mv * old_folder",
@@ -160,40 +596,73 @@ class Audio_Tuner:
                             "mv * ..",
                             "rm -rf old_folder"],
                             stdout=True)
+        os.remove(tar_path)
 
     def convert_mdef(self):
         #run_cmds("sudo apt -y install pocketsphinx")
-        run_cmds([f"cd {self.tuned_path}",
-                        "git clone git@github.com:cmusphinx/pocketsphinx.git",
-                        "cd pocketsphinx",
-                        "./autogen.sh",
-                        f"make -j {cpu_count()}",
-                        "sudo make install"],
-                        stdout=True)
-        tool_path = os.path.join(self.tuned_path,
-                                 "pocketsphinx",
-                                 "src",
-                                 "programs",
-                                 "pocketsphinx_mdef_convert")
+        pocketsphinx_path = self.built_repo("pocketsphinx")
+        # Not the in-tree libtool wrapper, running it changes the tree
+        tool_path = "/usr/local/bin/pocketsphinx_mdef_convert"
+        self.make_install(pocketsphinx_path, tool_path)
         path = os.path.join(self.tuned_path, "en-us/mdef")
+        if (os.path.exists(f"{path}.txt")
+                and os.path.getmtime(f"{path}.txt") >= os.path.getmtime(path)):
+            logging.info("mdef.txt is up to date")
+            return
         run_cmds(f"{tool_path} -text {path} {path}.txt",
                         stdout=True)
 
     def download_sphinxtrain(self):
         # Must get installed from source for fixes
-        run_cmds([f"cd {self.tuned_path}",
-                        "git clone git@github.com:cmusphinx/sphinxtrain.git",
-                        "cd sphinxtrain",
-                        "./autogen.sh",
-                        f"make -j {cpu_count()}",
-                        "sudo make install"],
-                        stdout=True)
+        path = self.built_repo("sphinxtrain")
+        self.make_install(path, "/usr/local/libexec/sphinxtrain/bw")
         for fname in ["bw", "map_adapt", "mk_s2sendump", "mllr_solve"]:
             old_path = os.path.join("/usr/local/libexec/sphinxtrain/", fname)
             new_path = os.path.join(self.tuned_path, fname)
-            run_cmds(f"cp {old_path} {new_path}")
-        
+            if not self.same_file(old_path, new_path):
+                copy2(old_path, new_path)
+
     def run_bw(self):
+        """Accumulates counts only for recordings no batch covers yet
+
+        Counts from separate bw runs add up in map_adapt, so each run's
+        new recordings become a batch with its own accumdirs, recorded
+        in the manifest. Batches accumulated against another model or
+        that hold recordings which were removed are dropped, and their
+        recordings are accumulated again"""
+
+        # run_sphinx_fe may have been skipped on a resumed run
+        self.hash_wavs(self.read_file_ids())
+        model = self.model_fingerprint()
+        manifest = self.read_manifest()
+        batches = manifest["batches"] if manifest.get("model") == model else {}
+        current = {wav_hash: file_id
+                   for file_id, wav_hash in self.wav_hashes.items()}
+        batches = {batch_id: batch for batch_id, batch in batches.items()
+                   if set(batch["wavs"]) <= current.keys()}
+        covered = set().union(*[batch["wavs"] for batch in batches.values()])
+        new = [file_id for wav_hash, file_id in current.items()
+               if wav_hash not in covered]
+        logging.info(f"Accumulating {len(new)}/{len(current)} recordings, "
+                     f"reusing {len(batches)} batches")
+        if new:
+            batch_id = self.session_id.strip("_")
+            shards = self.write_shards(new, os.path.join(self.accum_root,
+                                                         batch_id))
+            batches[batch_id] = {
+                "wavs": [self.wav_hashes[x] for x in new],
+                "accum_dirs": self.map_shards(self.run_bw_shard, shards)}
+        if os.path.exists(self.accum_root):
+            delete_paths([os.path.join(self.accum_root, x)
+                          for x in os.listdir(self.accum_root)
+                          if x not in batches])
+        self.write_manifest({"model": model, "batches": batches})
+
+    def run_bw_shard(self, shard):
+        """Accumulates one shard's counts, returns its accumdir"""
+
+        accum_dir = shard + "_accum"
+        makedirs(accum_dir, remake=True)
         run_cmds([f"cd {self.tuned_path}",
                         ("sudo ./bw \\\n"
                          " -hmmdir en-us \\\n"
@@ -206,17 +675,22 @@ class Audio_Tuner:
                          " -cmn current \\\n"
                          " -agc none \\\n"
                          " -dictfn cmudict-en-us.dict \\\n"
-                         f" -ctlfn {self.file_ids_name} \\\n"
-                         f" -lsnfn {self.transcription_name} \\\n"
-                         " -accumdir .")], stdout=True)
+                         f" -ctlfn {shard}.fileids \\\n"
+                         f" -lsnfn {shard}.transcription \\\n"
+                         f" -accumdir {accum_dir}")],
+                 stdout=True)
+        return accum_dir
 
     def run_adapt(self):
         cmds = [f"cd {self.tuned_path}",
+                # cp -R would nest into the last run's en-us-adapt
+                "rm -rf en-us-adapt",
                 "cp -R en-us en-us-adapt",
                 ("./map_adapt -moddeffn en-us/mdef.txt -ts2cbfn .cont. "
                  "-meanfn en-us/means -varfn en-us/variances -mixwfn "
                  "en-us/mixture_weights -tmatfn en-us/transition_matrices "
-                 "-accumdir . -mapmeanfn en-us-adapt/means -mapvarfn "
+                 f"-accumdir {self.accum_dirs} "
+                 "-mapmeanfn en-us-adapt/means -mapvarfn "
                  "en-us-adapt/variances -mapmixwfn "
                  "en-us-adapt/mixture_weights -maptmatfn "
                  "en-us-adapt/transition_matrices")]
@@ -229,60 +703,28 @@ class Audio_Tuner:
                   ("./mllr_solve\\\n"
                    " -meanfn en-us/means \\\n"
                    " -varfn en-us/variances \\\n"
-                   " -outmllrfn mllr_matrix -accumdir .")],
+                   f" -outmllrfn mllr_matrix -accumdir {self.accum_dirs}")],
                   stdout=True)
 
-    def write_test_files(self):
-        makedirs(self.test_dir)
-        wav_dir = os.path.join(self.test_dir, "wav/")
-        makedirs(wav_dir)
-        old_lm = os.path.join(self.tuned_path, "en-us.lm.bin")
-        new_lm = os.path.join(self.test_dir, "en-us.lm.bin")
-        old_dict = os.path.join(self.tuned_path, "cmudict-en-us.dict")
-        new_dict = os.path.join(self.test_dir, "cmudict-en-us.dict")
-        old_hmm = os.path.join(self.tuned_path, "en-us")
-        new_hmm = os.path.join(self.test_dir, "en-us")
-        old_mllr_matrix = os.path.join(self.tuned_path, "mllr_matrix")
-        new_mllr_matrix = os.path.join(self.test_dir, "mllr_matrix")
-        run_cmds([f"cd {self.tuned_path}",
-                  f"cp {self.file_ids_path} {self.test_file_ids_path}",
-                  (f"cp {self.transcription_path} "
-                   f"{self.test_transcription_path}"),
-                   f"cp *wav {wav_dir}",
-                   f"cp {old_lm} {new_lm}",
-                   f"cp {old_dict} {new_dict}",
-                   f"cp -R {old_hmm} {new_hmm}",
-                   #f"cp {old_mllr_matrix} {new_mllr_matrix}",
-                   f"cp {self.tuned_path}/sphinxtrain/scripts/decode/word_align.pl ./test/"],
-                   stdout=True)
-
-    def run_test_decoder(self):
-        for adapt in [False, True]:
-            if adapt:
-                run_cmds([f"cd {self.tuned_path}",
-                          f"rm -rf test/en-us",
-                          f"cp -R en-us-adapt test/en-us"])
-            tool_path = os.path.join(self.tuned_path,
-                                     "pocketsphinx",
-                                     "src",
-                                     "programs",
-                                     "pocketsphinx_batch")
-            run_cmds((f"cd {self.test_dir} && \\\n"
-                      f"{tool_path} \\\n"
-                      f" -adcin yes \\\n"
-                      f" -cepdir wav \\\n"
-                      f" -cepext .wav \\\n"
-                      f" -ctl test.fileids \\\n"
-                      f" -lm en-us.lm.bin \\\n"
-                      f" -dict cmudict-en-us.dict \\\n"
-                      f" -hmm en-us \\\n"  # for example en-us
-                      f" -hyp test.hyp"),
-                            stdout=True)
-            run_cmds([f"cd {self.test_dir}",
-                      "perl word_align.pl test.transcription test.hyp"],
-                      stdout=True)
-            input(f"test complete with adapt as {adapt}, hit enter")
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
 
+    def write_manifest(self, manifest):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def accum_dirs(self):
+        """Every batch's accumdirs, map_adapt sums their counts"""
+
+        return " ".join(accum_dir
+                        for batch in self.read_manifest()["batches"].values()
+                        for accum_dir in batch["accum_dirs"])
 
     def record_phrase(self, phrase, fname):
         satisfied = False
@@ -306,18 +748,15 @@ class Audio_Tuner:
         # TODO: refactor this to include this stuff as class attrs of wrapper
         stream, p, chunk_size = sr.Speech_Recognition_Wrapper.start_audio(self)
         write_to_stdout("Ready! Record, then hit enter!")
-        frames = []
-        while q.empty():
-            frames.append(stream.read(chunk_size))
-        frames.append(stream.read(chunk_size))
+        path = self.file_to_audio_path(fname) + ".wav"
+        # Streams to disk so memory doesn't grow with the recording
+        with Wav_Writer(path, trim_silence=self.trim_silence) as writer:
+            while q.empty():
+                writer.write(stream.read(chunk_size))
+            writer.write(stream.read(chunk_size))
         stream.close()
         p.terminate()
-
-        with wave.open(self.file_to_audio_path(fname) + ".wav", 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(p.get_sample_size(pyaudio.paInt16))
-            wf.setframerate(16000)
-            wf.writeframes(b''.join(frames))
+        logging.debug(f"Recorded {path}: {writer.stats}")
 
 
     def phrase_iter(self):
@@ -362,7 +801,25 @@ class Audio_Tuner:
     def audio_file_ids_path(self):
         return os.path.join(self.audio_path, self.file_ids_name)
 
+    @property
+    def augmented_path(self):
+        return os.path.join(self.audio_path, Audio_Augmenter.dir_name)
+
+
+
+    @property
+    def accum_root(self):
+        return os.path.join(self.tuned_path, self.accum_dir_name)
 
+    @property
+    def manifest_path(self):
+        return os.path.join(self.tuned_path, self.manifest_name)
+
+    @property
+    def session_path(self):
+        return os.path.join(self.tuned_path,
+                            self.stages_dir_name,
+                            self.session_name)
 
     @property
     def transcription_path(self):
@@ -375,11 +832,3 @@ class Audio_Tuner:
     @property
     def test_dir(self):
         return os.path.join(self.tuned_path, "test")
-
-    @property
-    def test_transcription_path(self):
-        return os.path.join(self.test_dir, self.test_transcription_name)
-
-    @property
-    def test_file_ids_path(self):
-        return os.path.join(self.test_dir, self.test_file_ids_name)
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import logging
+import os
+from multiprocessing import Pool, cpu_count
+from time import perf_counter
+
+import numpy as np
+
+from . import language_dict
+from .audio_sources import Audio_Source, File_Audio_Source
+from .evaluation import read_transcriptions
+from .wav_writer import Wav_Writer
+
+int16_max = np.iinfo(np.int16).max
+
+
+def gain(samples, db):
+    return samples * 10 ** (db / 20)
+
+
+def change_speed(samples, factor):
+    """Resamples so it plays factor times faster, which also moves the
+    pitch by factor, like sox's speed effect"""
+
+    positions = np.arange(0, len(samples) - 1, factor)
+    return np.interp(positions, np.arange(len(samples)), samples)
+
+
+def add_noise(samples, snr_db, rng, noise=None):
+    """Adds noise scaled to snr_db below the signal's power
+
+    noise is a clip that's tiled and cut at a random offset, white
+    noise if None"""
+
+    if noise is None:
+        noise = rng.standard_normal(len(samples))
+    else:
+        noise = np.tile(noise, len(samples) // len(noise) + 2)
+        start = rng.integers(len(noise) - len(samples))
+        noise = noise[start:start + len(samples)]
+    signal_power = np.mean(samples ** 2)
+    noise_power = np.mean(noise ** 2) or 1
+    scale = np.sqrt(signal_power / (noise_power * 10 ** (snr_db / 10)))
+    return samples + noise * scale
+
+
+def room_impulse(rt60, rng, sample_rate=Audio_Source.sample_rate):
+    """Synthetic impulse response, noise decaying 60 dB over rt60 seconds"""
+
+    t = np.arange(int(rt60 * sample_rate)) / sample_rate
+    impulse = rng.standard_normal(len(t)) * 10 ** (-3 * t / rt60)
+    impulse[0] = 1
+    return impulse / np.sqrt(np.sum(impulse ** 2))
+
+
+def reverberate(samples, impulse):
+    """Convolves with impulse through the FFT, keeping the length"""
+
+    size = len(samples) + len(impulse) - 1
+    n = 1 << (size - 1).bit_length()
+    wet = np.fft.irfft(np.fft.rfft(samples, n) * np.fft.rfft(impulse, n), n)
+    return wet[:len(samples)]
+
+
+def read_samples(path):
+    with File_Audio_Source(path) as audio_source:
+        num_frames = int(audio_source.duration * audio_source.sample_rate)
+        buf = audio_source.read(num_frames)
+    return np.frombuffer(buf, dtype=np.int16).astype(np.float64)
+
+
+def variant_rng(seed, file_id, variant):
+    """Same numbers for a file and variant whichever worker makes it"""
+
+    digest = hashlib.sha256(f"{file_id}/{variant}".encode()).digest()
+    return np.random.default_rng([seed, int.from_bytes(digest[:8], "little")])
+
+
+# Noise clips, loaded once per worker process by _init_worker
+_noises = None
+
+
+def _init_worker(noise_paths):
+    global _noises
+    _noises = [read_samples(x) for x in noise_paths]
+
+
+def _augment_file(task):
+    file_id, path, out_dir, variants, seed = task
+    start = perf_counter()
+    try:
+        samples = read_samples(path)
+        mtime = os.stat(path).st_mtime_ns
+        made = []
+        for variant, (kind, value) in variants.items():
+            out_path = os.path.join(out_dir, f"{file_id}_{variant}.wav")
+            made.append(f"{file_id}_{variant}")
+            # Only rebuilt when the recording changed
+            if (os.path.exists(out_path)
+                    and os.stat(out_path).st_mtime_ns >= mtime):
+                continue
+            rng = variant_rng(seed, file_id, variant)
+            if kind == "gain":
+                out = gain(samples, value)
+            elif kind == "speed":
+                out = change_speed(samples, value)
+            elif kind == "snr":
+                noise = _noises[rng.integers(len(_noises))] if _noises else None
+                out = add_noise(samples, value, rng, noise)
+            elif kind == "reverb":
+                out = reverberate(samples, room_impulse(value, rng))
+            out = np.clip(np.rint(out), -int16_max - 1, int16_max)
+            with Wav_Writer(out_path) as writer:
+                writer.write(out.astype(np.int16).tobytes())
+    except Exception as e:
+        return {"file_id": file_id, "error": str(e)}
+    return {"file_id": file_id,
+            "made": made,
+            "seconds": perf_counter() - start}
+
+
+class Audio_Augmenter:
+    """Makes extra training audio out of recordings without re-recording
+
+    Each recording gets one copy per gain in gains_db, speed factor in
+    speeds (which moves pitch with it), SNR in snrs_db (white noise, or
+    clips from noise_paths) and reverb time in rt60s. Files are split
+    across workers processes. Output only depends on seed, so reruns
+    and other machines make the same files, and copies of recordings
+    that didn't change aren't remade"""
+
+    dir_name = "augmented"
+
+    def __init__(self,
+                 gains_db=(-6, 6),
+                 speeds=(0.9, 1.1),
+                 snrs_db=(20, 10),
+                 rt60s=(0.3,),
+                 noise_paths=(),
+                 seed=0,
+                 workers=None):
+        self.gains_db = list(gains_db)
+        self.speeds = list(speeds)
+        self.snrs_db = list(snrs_db)
+        self.rt60s = list(rt60s)
+        self.noise_paths = list(noise_paths)
+        self.seed = seed
+        self.workers = workers or cpu_count()
+
+    @property
+    def variants(self):
+        """variant name -> (kind, value), names go in the file ids"""
+
+        variants = dict()
+        for kind, values in [("gain", self.gains_db),
+                             ("speed", self.speeds),
+                             ("snr", self.snrs_db),
+                             ("reverb", self.rt60s)]:
+            for value in values:
+                name = f"aug_{kind}{value}".replace("-", "m").replace(".", "p")
+                variants[name] = (kind, value)
+        return variants
+
+    @property
+    def params(self):
+        """What the output depends on, for Stage params"""
+
+        return [self.gains_db, self.speeds, self.snrs_db, self.rt60s,
+                self.noise_paths, self.seed]
+
+    def clear_stale(self, out_dir):
+        """Removes copies made with other params, they'd be kept otherwise"""
+
+        params_path = os.path.join(out_dir, "params.json")
+        params = json.dumps(self.params)
+        if os.path.exists(params_path):
+            with open(params_path, "r") as f:
+                if f.read() == params:
+                    return
+        for fname in os.listdir(out_dir):
+            if fname.endswith(".wav"):
+                os.remove(os.path.join(out_dir, fname))
+        language_dict.atomic_write(params_path, params)
+
+    def run(self, file_ids_path, transcription_path, out_dir):
+        """Augments every file in file_ids_path into out_dir
+
+        out_dir gets its own fileids and transcription of the copies,
+        named like the originals, sorted and without duplicates.
+        Returns the number of copies"""
+
+        audio_dir = os.path.dirname(os.path.abspath(file_ids_path))
+        with open(file_ids_path, "r") as f:
+            file_ids = list(dict.fromkeys(x.strip() for x in f if x.strip()))
+        transcriptions = read_transcriptions(transcription_path)
+        os.makedirs(out_dir, exist_ok=True)
+        self.clear_stale(out_dir)
+        variants = self.variants
+        tasks = [(x, os.path.join(audio_dir, x + ".wav"), out_dir,
+                  variants, self.seed)
+                 for x in file_ids
+                 if x in transcriptions
+                 and os.path.exists(os.path.join(audio_dir, x + ".wav"))]
+        logging.info(f"Augmenting {len(tasks)} recordings "
+                     f"{len(variants)} ways with {self.workers} workers")
+        start = perf_counter()
+        entries = dict()
+        with Pool(self.workers,
+                  initializer=_init_worker,
+                  initargs=(self.noise_paths,)) as pool:
+            for result in pool.imap_unordered(_augment_file,
+                                              tasks,
+                                              chunksize=1):
+                if "error" in result:
+                    logging.warning(f"Not augmenting {result['file_id']}: "
+                                    f"{result['error']}")
+                    continue
+                phrase = " ".join(transcriptions[result["file_id"]])
+                for file_id in result["made"]:
+                    entries[file_id] = f"<s> {phrase} </s> ({file_id})"
+        file_ids = sorted(entries)
+        language_dict.atomic_write(
+            os.path.join(out_dir, os.path.basename(file_ids_path)),
+            "".join(x + "\n" for x in file_ids))
+        language_dict.atomic_write(
+            os.path.join(out_dir, os.path.basename(transcription_path)),
+            "".join(entries[x] + "\n" for x in file_ids))
+        logging.info(f"Augmentation took {perf_counter() - start:.1f}s")
+        return len(file_ids)
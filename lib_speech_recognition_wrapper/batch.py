@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+from time import perf_counter
+
+from pocketsphinx import Decoder
+
+from .audio_sources import File_Audio_Source
+from .keyword_spotter import spot_keywords
+from .speech_recognition_wrapper import Speech_Recognition_Wrapper
+
+# One decoder per worker process, built once by _init_worker
+_decoder = None
+
+
+def _init_worker(wrapper_kwargs):
+    global _decoder
+    # Finds the kws list and dict the parent cached
+    wrapper = Speech_Recognition_Wrapper(**wrapper_kwargs)
+    _decoder = Decoder(wrapper.config)
+
+
+def _decode_file(path):
+    start = perf_counter()
+    try:
+        with File_Audio_Source(path) as audio_source:
+            duration = audio_source.duration
+            detections = spot_keywords(_decoder, audio_source)
+    except Exception as e:
+        return {"file": path, "error": f"{type(e).__name__}: {e}"}
+    decode_seconds = perf_counter() - start
+    keywords = [x["keyword"] for x in detections]
+    return {"file": path,
+            "hypothesis": " ".join(keywords),
+            "keywords": sorted(set(keywords)),
+            "detections": detections,
+            "audio_seconds": duration,
+            "decode_seconds": decode_seconds,
+            "rtf": decode_seconds / duration if duration else None}
+
+
+class Batch_Keyword_Spotter:
+    """Runs keyword spotting over many WAV files across a process pool"""
+
+    def __init__(self,
+                 keywords_dict=None,
+                 removed_words=[],
+                 workers=None,
+                 dict_mode="full"):
+        self.wrapper_kwargs = {"keywords_dict": keywords_dict,
+                               "removed_words": removed_words,
+                               "dict_mode": dict_mode}
+        self.workers = workers or cpu_count()
+        # Caches the kws list and dict before the workers look them up
+        Speech_Recognition_Wrapper(**self.wrapper_kwargs)
+
+    def run(self, path, out=None):
+        """Writes one JSON line per file to out as results finish
+
+        path is a dir of .wav files or a fileids file like the ones
+        Audio_Tuner writes. Returns a summary dict"""
+
+        out = out or sys.stdout
+        paths = self.file_paths(path)
+        logging.info(f"Spotting keywords in {len(paths)} files "
+                     f"with {self.workers} workers")
+        start = perf_counter()
+        audio_seconds = 0
+        errors = 0
+        for result in self.iter_results(paths):
+            audio_seconds += result.get("audio_seconds", 0)
+            errors += "error" in result
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+        wall_seconds = perf_counter() - start
+        summary = {"files": len(paths),
+                   "errors": errors,
+                   "workers": self.workers,
+                   "audio_seconds": audio_seconds,
+                   "wall_seconds": wall_seconds,
+                   "speedup": audio_seconds / wall_seconds if wall_seconds else None}
+        logging.info(f"Batch done: {summary}")
+        return summary
+
+    def iter_results(self, paths):
+        """Yields result dicts in completion order"""
+
+        with Pool(self.workers,
+                  initializer=_init_worker,
+                  initargs=(self.wrapper_kwargs,)) as pool:
+            # chunksize 1 keeps cores busy when file lengths vary
+            yield from pool.imap_unordered(_decode_file, paths, chunksize=1)
+
+    def file_paths(self, path):
+        """Returns wav paths, longest first so stragglers start early"""
+
+        if os.path.isdir(path):
+            paths = [os.path.join(path, x) for x in os.listdir(path)
+                     if x.lower().endswith(".wav")]
+        else:
+            # fileids are names relative to their dir, without .wav
+            _dir = os.path.dirname(os.path.abspath(path))
+            with open(path, "r") as f:
+                paths = [os.path.join(_dir, line.strip() + ".wav")
+                         for line in f if line.strip()]
+        sizes = {x: os.path.getsize(x) if os.path.exists(x) else 0
+                 for x in paths}
+        return sorted(paths, key=lambda x: (-sizes[x], x))
@@ -0,0 +1 @@
+"""Benchmarks, run with python -m lib_speech_recognition_wrapper.benchmarks.<name>"""
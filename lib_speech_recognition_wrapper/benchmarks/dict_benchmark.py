@@ -0,0 +1,49 @@
+import json
+import multiprocessing
+from statistics import median
+from time import perf_counter
+
+from pocketsphinx import Decoder
+
+from ..process_stats import rss_mb
+from ..speech_recognition_wrapper import Speech_Recognition_Wrapper
+
+
+def _measure(dict_mode, q):
+    wrapper = Speech_Recognition_Wrapper(dict_mode=dict_mode)
+    rss_before = rss_mb()
+    start = perf_counter()
+    decoder = Decoder(wrapper.config)
+    init_seconds = perf_counter() - start
+    q.put({"init_seconds": init_seconds,
+           "decoder_rss_mb": rss_mb() - rss_before,
+           "total_rss_mb": rss_mb()})
+    # Held until after the RSS readings so they include it
+    del decoder
+
+
+def run_dict_benchmark(repeats=5):
+    """Decoder init time and RSS for the full and compact dicts
+
+    Each measurement runs in a fresh process so memory isn't shared
+    between runs"""
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for dict_mode in ["full", "compact"]:
+        # Warms the dict cache so only decoder init is measured
+        Speech_Recognition_Wrapper(dict_mode=dict_mode)
+        runs = []
+        for _ in range(repeats):
+            q = ctx.Queue()
+            p = ctx.Process(target=_measure, args=(dict_mode, q))
+            p.start()
+            runs.append(q.get())
+            p.join()
+        results[dict_mode] = {key: median(x[key] for x in runs)
+                              for key in runs[0]}
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run_dict_benchmark(), indent=4))
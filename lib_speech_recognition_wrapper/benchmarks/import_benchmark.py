@@ -0,0 +1,64 @@
+import json
+from statistics import median
+import subprocess
+import sys
+from time import perf_counter
+
+# Modules that should only load when they're used
+heavy_modules = ["pocketsphinx", "pyaudio", "numpy", "pathos", "lib_utils",
+                 "tarfile", "asyncio", "http.server"]
+
+_help_code = """
+import runpy, sys
+sys.argv = ["lib_speech_recognition_wrapper", "--help"]
+try:
+    runpy.run_module("lib_speech_recognition_wrapper", run_name="__main__")
+except SystemExit:
+    pass
+"""
+
+targets = {"interpreter": "pass",
+           "import": "import lib_speech_recognition_wrapper",
+           "help": _help_code,
+           "import_wrapper": ("from lib_speech_recognition_wrapper "
+                              "import Speech_Recognition_Wrapper")}
+
+
+def _run(code):
+    """Wall seconds of a fresh interpreter running code, and the heavy
+    modules it loaded. Imports that fail are reported, not raised"""
+
+    code += ("\nimport json, sys\n"
+             f"print(json.dumps([x for x in {heavy_modules!r} "
+             "if x in sys.modules]), file=sys.stderr)\n")
+    start = perf_counter()
+    p = subprocess.run([sys.executable, "-c", code],
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE,
+                       text=True)
+    seconds = perf_counter() - start
+    if p.returncode != 0:
+        return seconds, None, p.stderr.strip().splitlines()[-1]
+    return seconds, json.loads(p.stderr.strip().splitlines()[-1]), None
+
+
+def run_import_benchmark(repeats=10):
+    """Startup time of importing the package and of --help
+
+    Each run is a fresh interpreter. seconds is the median wall time,
+    over_interpreter is that minus a bare interpreter's"""
+
+    results = {}
+    for name, code in targets.items():
+        runs = [_run(code) for _ in range(repeats)]
+        results[name] = {"seconds": median(x[0] for x in runs),
+                         "heavy_modules": runs[-1][1],
+                         "error": runs[-1][2]}
+    baseline = results["interpreter"]["seconds"]
+    for result in results.values():
+        result["over_interpreter"] = result["seconds"] - baseline
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run_import_benchmark(), indent=4))
@@ -0,0 +1,56 @@
+import json
+import random
+from timeit import timeit
+
+from ..defaults import default_keywords_dict
+from ..keyword_matcher import Keyword_Matcher
+
+
+def suffix_scan(hypstr, keywords):
+    """What run_decoder used to do for every partial hypothesis"""
+
+    split_words = hypstr.lower().split()
+    for i in range(len(split_words)):
+        together = " ".join(split_words[i:])
+        if together in keywords:
+            return together
+    return None
+
+
+def partial_hypotheses(num_words, seed=0):
+    """Growing hypotheses of one utterance, like the decoder emits"""
+
+    random.seed(seed)
+    vocab = ["the", "a", "go", "to", "class", "window", "now", "please"]
+    words = [random.choice(vocab).upper() for _ in range(num_words)]
+    return [" ".join(words[:i]) for i in range(1, num_words + 1)]
+
+
+def run_keyword_matcher_benchmark(lengths=(5, 25, 100), number=200):
+    """Seconds per utterance for the old suffix scan vs Keyword_Matcher"""
+
+    keywords = dict.fromkeys(default_keywords_dict)
+    matcher = Keyword_Matcher(keywords)
+    results = {}
+    for num_words in lengths:
+        hyps = partial_hypotheses(num_words)
+
+        def old():
+            for hypstr in hyps:
+                suffix_scan(hypstr, keywords)
+
+        def new():
+            matcher.reset()
+            for hypstr in hyps:
+                matcher.update(hypstr)
+
+        old_seconds = timeit(old, number=number) / number
+        new_seconds = timeit(new, number=number) / number
+        results[num_words] = {"suffix_scan_seconds": old_seconds,
+                              "keyword_matcher_seconds": new_seconds,
+                              "speedup": old_seconds / new_seconds}
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run_keyword_matcher_benchmark(), indent=4))
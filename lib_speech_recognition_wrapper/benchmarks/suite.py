@@ -0,0 +1,167 @@
+from argparse import ArgumentParser
+from datetime import datetime
+import json
+import multiprocessing
+import os
+import platform
+from statistics import median
+import tempfile
+from time import perf_counter, process_time
+import wave
+
+import numpy as np
+from pocketsphinx import Decoder
+
+from .. import language_dict
+from ..audio_sources import Audio_Source, File_Audio_Source
+from ..keyword_spotter import Keyword_Spotter
+from ..process_stats import peak_rss_mb
+from ..speech_recognition_wrapper import Speech_Recognition_Wrapper
+from .dict_benchmark import run_dict_benchmark
+from .import_benchmark import run_import_benchmark
+from .keyword_matcher_benchmark import run_keyword_matcher_benchmark
+
+
+def write_fixture(path, seconds, seed):
+    """Synthetic 16 kHz WAV: background noise with voiced-like bursts
+
+    Decodes deterministically for a given seed. Won't contain keywords,
+    pass real recordings with --fixtures to measure detections"""
+
+    rng = np.random.default_rng(seed)
+    sample_rate = Audio_Source.sample_rate
+    audio = rng.normal(0, 100, int(seconds * sample_rate))
+    t = np.arange(int(.6 * sample_rate)) / sample_rate
+    envelope = np.hanning(len(t))
+    for start in np.arange(.5, seconds - 1, 2):
+        pitch = rng.uniform(100, 250)
+        burst = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        i = int(start * sample_rate)
+        audio[i:i + len(t)] += 6000 * envelope * burst
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.clip(audio, -32768, 32767).astype(np.int16).tobytes())
+
+
+def _measure_startup(q, dict_mode):
+    # Fresh cache dir so dict writing is included
+    with tempfile.TemporaryDirectory() as cache_dir:
+        language_dict.cache_dir = cache_dir
+        start = perf_counter()
+        wrapper = Speech_Recognition_Wrapper(dict_mode=dict_mode)
+        config_seconds = perf_counter() - start
+        start = perf_counter()
+        Speech_Recognition_Wrapper(dict_mode=dict_mode)
+        warm_config_seconds = perf_counter() - start
+        start = perf_counter()
+        Decoder(wrapper.config)
+        decoder_seconds = perf_counter() - start
+    q.put({"cold_config_seconds": config_seconds,
+           "warm_config_seconds": warm_config_seconds,
+           "decoder_init_seconds": decoder_seconds,
+           "total_seconds": config_seconds + decoder_seconds})
+
+
+def _measure_decoding(q, paths, dict_mode, chunk_size):
+    decoder = Decoder(Speech_Recognition_Wrapper(dict_mode=dict_mode).config)
+    audio_seconds = wall_seconds = cpu_seconds = 0
+    chunk_seconds = []
+    detection_latencies = []
+    detections = 0
+    for path in paths:
+        with File_Audio_Source(path, chunk_size=chunk_size) as audio_source:
+            spotter = Keyword_Spotter(decoder)
+            for buf in audio_source:
+                start_wall, start_cpu = perf_counter(), process_time()
+                found = spotter.process(buf)
+                chunk_seconds.append(perf_counter() - start_wall)
+                wall_seconds += chunk_seconds[-1]
+                cpu_seconds += process_time() - start_cpu
+                for detection in found:
+                    detections += 1
+                    # Audio heard after the keyword ended, plus compute
+                    detection_latencies.append(spotter.audio_seconds
+                                               - detection["end"]
+                                               + chunk_seconds[-1])
+            detections += len(spotter.finish())
+            audio_seconds += spotter.audio_seconds
+    q.put({"audio_seconds": audio_seconds,
+           "real_time_factor": wall_seconds / audio_seconds,
+           "cpu_seconds_per_audio_second": cpu_seconds / audio_seconds,
+           "chunk_seconds_median": median(chunk_seconds),
+           "chunk_seconds_max": max(chunk_seconds),
+           "detections": detections,
+           "detection_latency_median": (median(detection_latencies)
+                                        if detection_latencies else None),
+           "peak_rss_mb": peak_rss_mb()})
+
+
+def _isolated(func, *args):
+    """Runs func in a fresh process so timings and RSS don't leak"""
+
+    ctx = multiprocessing.get_context("spawn")
+    q = ctx.Queue()
+    p = ctx.Process(target=func, args=(q,) + args)
+    p.start()
+    result = q.get()
+    p.join()
+    return result
+
+
+def run_suite(fixtures_dir=None, dict_modes=("full", "compact"), repeats=3):
+    """Runs every benchmark, returns a JSON serializable dict"""
+
+    tmp_dir = None
+    if fixtures_dir is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        fixtures_dir = tmp_dir.name
+        for seed, seconds in enumerate([5, 30, 120]):
+            write_fixture(os.path.join(fixtures_dir, f"synthetic_{seed}.wav"),
+                          seconds,
+                          seed)
+    paths = sorted(os.path.join(fixtures_dir, x)
+                   for x in os.listdir(fixtures_dir) if x.endswith(".wav"))
+
+    results = {"startup": {}, "decoding": {}}
+    for dict_mode in dict_modes:
+        runs = [_isolated(_measure_startup, dict_mode)
+                for _ in range(repeats)]
+        results["startup"][dict_mode] = {key: median(x[key] for x in runs)
+                                         for key in runs[0]}
+        # Mic sized chunks so latency matches live use
+        results["decoding"][dict_mode] = _isolated(_measure_decoding,
+                                                   paths,
+                                                   dict_mode,
+                                                   1024)
+    results["dict"] = run_dict_benchmark(repeats)
+    results["keyword_matcher"] = run_keyword_matcher_benchmark()
+    results["import"] = run_import_benchmark()
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+    return {"timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "fixtures": [os.path.basename(x) for x in paths],
+            "results": results}
+
+
+def main():
+    parser = ArgumentParser(description="lib_speech_recognition_wrapper "
+                                        "benchmarks")
+    # Dir of 16 kHz mono wavs, synthetic ones are generated otherwise
+    parser.add_argument("--fixtures", default=None)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--repeats", default=3, type=int)
+    args = parser.parse_args()
+    results = run_suite(args.fixtures, repeats=args.repeats)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
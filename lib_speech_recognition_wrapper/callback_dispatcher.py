@@ -0,0 +1,183 @@
+from collections import defaultdict
+import logging
+import queue
+import threading
+from time import perf_counter
+
+from .metrics import Latency_Histogram
+
+
+class _Ticket:
+    """Tracks one submitted callback so its slot is released only once"""
+
+    def __init__(self, key):
+        self.key = key
+        self.released = False
+        # Set once a spare worker took the place of the one running it
+        self.replaced = False
+        self.queued_at = perf_counter()
+
+
+class Callback_Dispatcher:
+    """Runs keyword/time callbacks on a thread pool
+
+    At most concurrency callbacks run at once and max_pending more can
+    wait. When full, new callbacks are dropped. With the coalesce policy
+    a callback whose key is already queued or running is also dropped,
+    so repeating a command doesn't pile up handlers.
+
+    Python threads can't be killed, so a callback that exceeds timeout
+    is abandoned: it's logged, counted, its slot is freed and a spare
+    worker takes the place of the stuck one, which exits if it ever
+    returns. Past max_abandoned stuck workers no spares are started and
+    abandoned callbacks keep their slots until they return"""
+
+    policies = ("drop", "coalesce")
+
+    def __init__(self,
+                 concurrency=2,
+                 max_pending=8,
+                 timeout=None,
+                 policy="coalesce",
+                 metrics=None,
+                 max_abandoned=4):
+        if policy not in self.policies:
+            raise ValueError(f"policy must be one of {self.policies}")
+        self.timeout = timeout
+        self.policy = policy
+        self.metrics = metrics
+        self.max_abandoned = max_abandoned
+        self._slots = threading.BoundedSemaphore(concurrency + max_pending)
+        self._pending = defaultdict(int)
+        self._cond = threading.Condition()
+        self._queue = queue.SimpleQueue()
+        self._threads = []
+        # Workers stuck in an abandoned callback, each replaced by a spare
+        self._abandoned = 0
+        for _ in range(concurrency):
+            self._start_worker()
+        self.submitted = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.timed_out = 0
+        self.errors = 0
+        # Per key execution time, plus overall time spent queued
+        self.latency = defaultdict(Latency_Histogram)
+        self.queue_delay = Latency_Histogram()
+
+    def submit(self, key, func, *args):
+        """Queues func(*args), returns False if it was dropped"""
+
+        with self._cond:
+            if self.policy == "coalesce" and self._pending[key]:
+                self.coalesced += 1
+                return False
+            if not self._slots.acquire(blocking=False):
+                self.dropped += 1
+                logging.warning(f"Callback queue full, dropped {key}")
+                return False
+            self._pending[key] += 1
+            self.submitted += 1
+        self._queue.put((_Ticket(key), func, args))
+        return True
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._work,
+                                  name=f"callback_{len(self._threads)}",
+                                  daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            ticket = job[0]
+            self._run(*job)
+            with self._cond:
+                if ticket.replaced:
+                    # A spare took this worker's place while it was stuck
+                    self._abandoned -= 1
+                    return
+
+    def _run(self, ticket, func, args):
+        start = perf_counter()
+        self.queue_delay.observe(start - ticket.queued_at)
+        timer = None
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, self._abandon, (ticket,))
+            timer.daemon = True
+            timer.start()
+        try:
+            func(*args)
+        except Exception as e:
+            with self._cond:
+                self.errors += 1
+            logging.exception(f"Callback {ticket.key} failed: {e}")
+        finally:
+            if timer is not None:
+                timer.cancel()
+            seconds = perf_counter() - start
+            self.latency[ticket.key].observe(seconds)
+            if self.metrics is not None:
+                self.metrics.observe("callback_seconds",
+                                     seconds,
+                                     callback=str(ticket.key))
+            self._release(ticket)
+
+    def _abandon(self, ticket):
+        logging.warning(f"Callback {ticket.key} exceeded {self.timeout}s")
+        with self._cond:
+            if ticket.released:
+                return
+            self.timed_out += 1
+            if self._abandoned >= self.max_abandoned:
+                logging.warning(f"{self._abandoned} callbacks are stuck, "
+                                f"{ticket.key} keeps its slot")
+                return
+            self._abandoned += 1
+            ticket.replaced = True
+            self._start_worker()
+        self._release(ticket)
+
+    def _release(self, ticket):
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._pending[ticket.key] -= 1
+            self._slots.release()
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Waits for every queued and running callback"""
+
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not any(self._pending.values()), timeout)
+
+    def shutdown(self, wait=True):
+        """Stops the workers after the callbacks already queued
+
+        Waiting also waits for stuck callbacks"""
+
+        with self._cond:
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+    @property
+    def stats(self):
+        return {"submitted": self.submitted,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "timed_out": self.timed_out,
+                "errors": self.errors,
+                "queue_delay": self.queue_delay.as_dict(),
+                "latency": {str(k): v.as_dict()
+                            for k, v in self.latency.items()}}
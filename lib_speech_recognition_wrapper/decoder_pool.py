@@ -0,0 +1,150 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import os
+import threading
+from time import monotonic, perf_counter
+
+from pocketsphinx import Decoder
+
+from .metrics import Latency_Histogram
+from .process_stats import rss_mb
+
+
+class Decoder_Pool:
+    """Lends out warm Decoders keyed by a fingerprint of their config
+
+    Building a Decoder reloads the acoustic model, LM and dict, so
+    returned decoders are kept idle for reuse. Idle decoders are evicted
+    after max_idle_seconds, and least recently used ones go first when
+    there are more than max_decoders or the estimated memory is over
+    max_memory_mb. Decoders that are lent out are never evicted"""
+
+    # Config values that change what a decoder loads
+    fingerprint_keys = ["-hmm", "-lm", "-dict", "-kws", "-keyphrase",
+                        "-jsgf", "-fsg"]
+
+    def __init__(self, max_decoders=8, max_memory_mb=None, max_idle_seconds=300):
+        self.max_decoders = max_decoders
+        self.max_memory_mb = max_memory_mb
+        self.max_idle_seconds = max_idle_seconds
+        # fingerprint -> [(decoder, returned_at)], most recent last
+        self._idle = defaultdict(list)
+        # id(decoder) -> fingerprint for decoders that are lent out
+        self._lent = {}
+        # Measured RSS growth from building one decoder, per fingerprint
+        self._memory_mb = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.construction = Latency_Histogram()
+
+    def fingerprint(self, config):
+        values = []
+        for key in self.fingerprint_keys:
+            value = config.get_string(key)
+            # Catches a dict or kws list rewritten in place
+            mtime = (os.stat(value).st_mtime_ns
+                     if value and os.path.isfile(value) else None)
+            values.append([key, value, mtime])
+        return hashlib.sha256(json.dumps(values).encode()).hexdigest()[:16]
+
+    @contextmanager
+    def decoder(self, config):
+        decoder = self.acquire(config)
+        try:
+            yield decoder
+        finally:
+            self.release(decoder)
+
+    def acquire(self, config):
+        """Returns a decoder for config, the caller must start_utt"""
+
+        key = self.fingerprint(config)
+        with self._lock:
+            self._evict_idle()
+            if self._idle[key]:
+                decoder, _ = self._idle[key].pop()
+                self._lent[id(decoder)] = key
+                self.hits += 1
+                return decoder
+            self.misses += 1
+            # Makes room before adding one more
+            self._evict(extra_decoders=1, extra_mb=self._memory_mb.get(key, 0))
+
+        rss_before = rss_mb()
+        start = perf_counter()
+        decoder = Decoder(config)
+        self.construction.observe(perf_counter() - start)
+        with self._lock:
+            self._memory_mb.setdefault(key, max(rss_mb() - rss_before, 0))
+            self._lent[id(decoder)] = key
+        logging.debug(f"Built decoder {key} in {perf_counter() - start:.2f}s")
+        return decoder
+
+    def release(self, decoder):
+        """Returns a decoder, ending its utterance if one is running"""
+
+        try:
+            decoder.end_utt()
+        except Exception:
+            # Wasn't in an utterance
+            pass
+        with self._lock:
+            key = self._lent.pop(id(decoder))
+            self._idle[key].append((decoder, monotonic()))
+            self._evict()
+
+    def _evict_idle(self):
+        cutoff = monotonic() - self.max_idle_seconds
+        for key, idle in self._idle.items():
+            fresh = [x for x in idle if x[1] >= cutoff]
+            self.evictions += len(idle) - len(fresh)
+            self._idle[key] = fresh
+
+    def _evict(self, extra_decoders=0, extra_mb=0):
+        """Drops least recently used idle decoders until under the caps"""
+
+        while self._over_limits(extra_decoders, extra_mb):
+            oldest = min(((idle[0][1], key) for key, idle
+                          in self._idle.items() if idle), default=None)
+            if oldest is None:
+                # Everything left is lent out
+                break
+            self._idle[oldest[1]].pop(0)
+            self.evictions += 1
+
+    def _over_limits(self, extra_decoders, extra_mb):
+        if self.num_decoders + extra_decoders > self.max_decoders:
+            return True
+        return (self.max_memory_mb is not None
+                and self.memory_mb + extra_mb > self.max_memory_mb)
+
+    @property
+    def num_decoders(self):
+        return len(self._lent) + sum(len(x) for x in self._idle.values())
+
+    @property
+    def memory_mb(self):
+        """Estimated memory of every decoder, lent or idle"""
+
+        keys = list(self._lent.values())
+        keys += [key for key, idle in self._idle.items() for _ in idle]
+        return sum(self._memory_mb.get(key, 0) for key in keys)
+
+    @property
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "lent": len(self._lent),
+                "idle": sum(len(x) for x in self._idle.values()),
+                "memory_mb": self.memory_mb,
+                "construction": self.construction.as_dict()}
+
+
+# Shared by every wrapper in the process
+default_decoder_pool = Decoder_Pool()
@@ -8,3 +8,7 @@ default_keywords_dict = {
 "start listening": -10,
 "end": -10,
 }
+
+# Where Audio_Tuner writes the adapted model. Here so that decoding
+# doesn't have to import the tuner and its toolchain
+tuned_path = "/etc/tuned"
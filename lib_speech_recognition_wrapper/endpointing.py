@@ -0,0 +1,38 @@
+class Endpointer:
+    """Decides when run_decoder restarts the utterance
+
+    Uses the decoder's voice activity state rather than hypothesis
+    strings: the utterance restarts silence_seconds after speech ends,
+    or after max_utterance_seconds of continuous speech. Times are
+    seconds of audio, not wall clock, so file sources behave the same"""
+
+    def __init__(self, silence_seconds=0, max_utterance_seconds=10):
+        self.silence_seconds = silence_seconds
+        self.max_utterance_seconds = max_utterance_seconds
+        self.restarts = {"end_of_speech": 0, "max_length": 0}
+        self.start(0)
+
+    def start(self, audio_time):
+        """Call whenever a new utterance starts"""
+
+        self.utt_start_time = audio_time
+        self.heard_speech = False
+        self.last_speech_time = audio_time
+
+    def update(self, audio_time, in_speech):
+        """Returns why the utterance should restart, or None"""
+
+        if in_speech:
+            self.heard_speech = True
+            self.last_speech_time = audio_time
+        elif (self.heard_speech
+                and audio_time - self.last_speech_time >= self.silence_seconds):
+            reason = "end_of_speech"
+            self.restarts[reason] += 1
+            return reason
+
+        if audio_time - self.utt_start_time > self.max_utterance_seconds:
+            reason = "max_length"
+            self.restarts[reason] += 1
+            return reason
+        return None
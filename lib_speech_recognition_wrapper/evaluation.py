@@ -0,0 +1,266 @@
+from collections import Counter
+import logging
+import os
+import re
+from multiprocessing import Pool, cpu_count
+from statistics import median
+from time import perf_counter
+
+from .audio_sources import File_Audio_Source
+from .keyword_spotter import Keyword_Spotter
+
+# Built once per worker process by _init_worker
+_configs = None
+_decoder_configs = dict()
+_decoder_pool = None
+
+
+def _init_worker(configs):
+    global _configs, _decoder_pool
+    # Only workers decode, so the scoring helpers don't need pocketsphinx
+    from .decoder_pool import Decoder_Pool
+
+    _configs = configs
+    # Every worker decodes with every config, so keep one of each warm
+    _decoder_pool = Decoder_Pool(max_decoders=len(configs))
+
+
+def _decoder_config(name):
+    if name not in _decoder_configs:
+        from pocketsphinx import DefaultConfig
+
+        config = DefaultConfig()
+        for key, value in _configs[name].items():
+            config.set_string(key, value)
+        config.set_string("-logfn", "/dev/null")
+        _decoder_configs[name] = config
+    return _decoder_configs[name]
+
+
+def _decode(task):
+    name, file_id, path = task
+    start = perf_counter()
+    result = {"config": name, "file_id": file_id}
+    try:
+        with _decoder_pool.decoder(_decoder_config(name)) as decoder, \
+                File_Audio_Source(path, chunk_size=1024) as audio_source:
+            if "-kws" in _configs[name]:
+                result.update(_spot(decoder, audio_source))
+            else:
+                decoder.start_utt()
+                for buf in audio_source:
+                    decoder.process_raw(buf, False, False)
+                decoder.end_utt()
+                hyp = decoder.hyp()
+                result["hypothesis"] = hyp.hypstr.lower() if hyp else ""
+            result["audio_seconds"] = audio_source.duration
+    except Exception as e:
+        result["error"] = str(e)
+    result["decode_seconds"] = perf_counter() - start
+    return result
+
+
+def _spot(decoder, audio_source):
+    spotter = Keyword_Spotter(decoder)
+    detections = []
+    latencies = []
+    for buf in audio_source:
+        start = perf_counter()
+        found = spotter.process(buf)
+        compute_seconds = perf_counter() - start
+        for detection in found:
+            # Audio heard after the keyword ended, plus compute
+            latencies.append(spotter.audio_seconds - detection["end"]
+                             + compute_seconds)
+        detections.extend(found)
+    detections.extend(spotter.finish())
+    return {"hypothesis": " ".join(x["keyword"] for x in detections),
+            "keywords": [x["keyword"] for x in detections],
+            "latencies": latencies}
+
+
+def word_errors(reference, hypothesis):
+    """Levenshtein alignment of two word lists
+
+    Returns (substitutions, deletions, insertions)"""
+
+    # Each cell is (edits, substitutions, deletions, insertions)
+    previous = [(j, 0, 0, j) for j in range(len(hypothesis) + 1)]
+    for i, ref_word in enumerate(reference, 1):
+        current = [(i, 0, i, 0)]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            diag = previous[j - 1]
+            if ref_word == hyp_word:
+                best = diag
+            else:
+                best = min((diag[0] + 1, diag[1] + 1, diag[2], diag[3]),
+                           (previous[j][0] + 1, previous[j][1],
+                            previous[j][2] + 1, previous[j][3]),
+                           (current[j - 1][0] + 1, current[j - 1][1],
+                            current[j - 1][2], current[j - 1][3] + 1))
+            current.append(best)
+        previous = current
+    return previous[-1][1:]
+
+
+def count_phrase(words, phrase):
+    """Non overlapping occurrences of phrase in a list of words"""
+
+    phrase = phrase.split()
+    count = i = 0
+    while i <= len(words) - len(phrase):
+        if words[i:i + len(phrase)] == phrase:
+            count += 1
+            i += len(phrase)
+        else:
+            i += 1
+    return count
+
+
+def read_kws_keywords(path):
+    """Keyword phrases of a kws list, "GO TO SCHOOL /1e-10/" lines"""
+
+    with open(path, "r") as f:
+        return [line.rsplit("/", 2)[0].strip().lower()
+                for line in f if line.strip()]
+
+
+def read_transcriptions(path):
+    """fileid -> reference words from "<s> text </s> (fileid)" lines"""
+
+    transcriptions = dict()
+    with open(path, "r") as f:
+        for line in f:
+            match = re.match(r"(.*)\(([^()]*)\)\s*$", line)
+            if match:
+                text = re.sub(r"</?s>", " ", match.group(1))
+                transcriptions[match.group(2)] = text.lower().split()
+    return transcriptions
+
+
+class Model_Evaluator:
+    """Decodes a held out set with several decoder configs in parallel
+
+    configs maps a name to pocketsphinx options such as -hmm, -lm and
+    -dict. Configs with -lm are scored by word error rate, configs with
+    -kws by keyword precision, recall and latency"""
+
+    def __init__(self,
+                 configs,
+                 fileids_path,
+                 transcription_path,
+                 audio_dir=None,
+                 workers=None):
+        self.configs = configs
+        self.transcriptions = read_transcriptions(transcription_path)
+        audio_dir = audio_dir or os.path.dirname(os.path.abspath(fileids_path))
+        with open(fileids_path, "r") as f:
+            file_ids = [x.strip() for x in f if x.strip()]
+        self.paths = {x: os.path.join(audio_dir, x + ".wav") for x in file_ids}
+        self.keywords = {name: read_kws_keywords(options["-kws"])
+                         for name, options in configs.items()
+                         if "-kws" in options}
+        self.workers = workers or cpu_count()
+
+    def run(self):
+        """Returns a report dict with one entry per config"""
+
+        tasks = [(name, file_id, path)
+                 for file_id, path in self.paths.items()
+                 for name in self.configs]
+        logging.info(f"Evaluating {len(self.configs)} configs on "
+                     f"{len(self.paths)} files with {self.workers} workers")
+        start = perf_counter()
+        results = {name: [] for name in self.configs}
+        with Pool(self.workers,
+                  initializer=_init_worker,
+                  initargs=(self.configs,)) as pool:
+            # chunksize 1 keeps cores busy when file lengths vary
+            for result in pool.imap_unordered(_decode, tasks, chunksize=1):
+                results[result["config"]].append(result)
+        report = {name: self.score(name, results[name])
+                  for name in self.configs}
+        logging.info(f"Evaluation took {perf_counter() - start:.1f}s")
+        return report
+
+    def score(self, name, results):
+        ok = [x for x in results if "error" not in x]
+        audio_seconds = sum(x["audio_seconds"] for x in ok)
+        decode_seconds = sum(x["decode_seconds"] for x in ok)
+        score = {"files": len(results),
+                 "errors": len(results) - len(ok),
+                 "audio_seconds": audio_seconds,
+                 "rtf": decode_seconds / audio_seconds if audio_seconds else None}
+        if name in self.keywords:
+            score.update(self.score_keywords(self.keywords[name], ok))
+        else:
+            score.update(self.score_words(ok))
+        return score
+
+    def score_words(self, results):
+        substitutions = deletions = insertions = words = sentence_errors = 0
+        for result in results:
+            reference = self.transcriptions.get(result["file_id"], [])
+            errors = word_errors(reference, result["hypothesis"].split())
+            substitutions += errors[0]
+            deletions += errors[1]
+            insertions += errors[2]
+            words += len(reference)
+            sentence_errors += any(errors)
+        edits = substitutions + deletions + insertions
+        return {"words": words,
+                "wer": edits / words if words else None,
+                "substitutions": substitutions,
+                "deletions": deletions,
+                "insertions": insertions,
+                "sentence_error_rate": (sentence_errors / len(results)
+                                        if results else None)}
+
+    def score_keywords(self, keywords, results):
+        expected = Counter()
+        detected = Counter()
+        true_positives = Counter()
+        latencies = []
+        for result in results:
+            reference = self.transcriptions.get(result["file_id"], [])
+            found = Counter(result["keywords"])
+            for keyword in keywords:
+                count = count_phrase(reference, keyword)
+                expected[keyword] += count
+                detected[keyword] += found[keyword]
+                true_positives[keyword] += min(count, found[keyword])
+            latencies.extend(result["latencies"])
+        per_keyword = {x: self._precision_recall(true_positives[x],
+                                                 detected[x],
+                                                 expected[x])
+                       for x in keywords}
+        return {**self._precision_recall(sum(true_positives.values()),
+                                         sum(detected.values()),
+                                         sum(expected.values())),
+                "latency_median": median(latencies) if latencies else None,
+                "latency_max": max(latencies, default=None),
+                "keywords": per_keyword}
+
+    @staticmethod
+    def _precision_recall(true_positives, detected, expected):
+        return {"precision": true_positives / detected if detected else None,
+                "recall": true_positives / expected if expected else None,
+                "false_alarms": detected - true_positives,
+                "misses": expected - true_positives}
+
+    @staticmethod
+    def format_report(report):
+        """Plain text table of a report from run"""
+
+        def fmt(value):
+            return "-" if value is None else f"{value:.3f}"
+
+        lines = [f"{'config':<20} {'wer':>7} {'prec':>7} {'recall':>7} "
+                 f"{'latency':>8} {'rtf':>7} {'errors':>6}"]
+        for name, score in report.items():
+            lines.append(f"{name:<20} {fmt(score.get('wer')):>7} "
+                         f"{fmt(score.get('precision')):>7} "
+                         f"{fmt(score.get('recall')):>7} "
+                         f"{fmt(score.get('latency_median')):>8} "
+                         f"{fmt(score['rtf']):>7} {score['errors']:>6}")
+        return "\n".join(lines)
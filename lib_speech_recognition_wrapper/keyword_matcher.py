@@ -0,0 +1,93 @@
+from collections import deque
+
+
+class Keyword_Matcher:
+    """Aho-Corasick automaton over hypothesis tokens
+
+    Built once from the keyword phrases. update is fed successive
+    partial hypotheses of one utterance and only consumes the tokens
+    added since the last call, reporting every keyword (overlapping ones
+    included) that ends in them"""
+
+    def __init__(self, keywords):
+        # State 0 is the root. Each state has token transitions, a
+        # failure link and the keywords that end at it
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build_failure_links()
+        self.reset()
+
+    def _add(self, keyword):
+        state = 0
+        for token in keyword.lower().split():
+            if token not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][token] = len(self._goto) - 1
+            state = self._goto[state][token]
+        self._out[state].append(keyword)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                # Keywords that are suffixes of this one also end here
+                self._out[child] = (self._out[child]
+                                    + self._out[self._fail[child]])
+
+    def reset(self):
+        """Call whenever the decoder starts a new utterance"""
+
+        self._state = 0
+        self._hypstr = ""
+
+    def step(self, token):
+        """Advances one token, returns keywords ending at it"""
+
+        state = self._state
+        while state and token not in self._goto[state]:
+            state = self._fail[state]
+        self._state = self._goto[state].get(token, 0)
+        return self._out[self._state]
+
+    def feed(self, tokens):
+        matches = []
+        for token in tokens:
+            matches.extend(self.step(token))
+        return matches
+
+    def update(self, hypstr):
+        """Returns keywords matched by the part of hypstr that's new
+
+        If the decoder revised earlier words the utterance is rescanned,
+        only reporting matches that end after the revision"""
+
+        prev = self._hypstr
+        self._hypstr = hypstr
+        if (hypstr.startswith(prev)
+                and (not prev
+                     or len(hypstr) == len(prev)
+                     or hypstr[len(prev)].isspace())):
+            return self.feed(hypstr[len(prev):].lower().split())
+
+        # Rare, so the token lists are only built here
+        old_tokens = prev.lower().split()
+        tokens = hypstr.lower().split()
+        unchanged = 0
+        for old, new in zip(old_tokens, tokens):
+            if old != new:
+                break
+            unchanged += 1
+        self._state = 0
+        self.feed(tokens[:unchanged])
+        return self.feed(tokens[unchanged:])
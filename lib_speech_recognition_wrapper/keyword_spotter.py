@@ -0,0 +1,93 @@
+import logging
+
+from .audio_sources import Audio_Source
+
+# pocketsphinx default -frate is 100 frames/s
+frames_per_second = 100
+samples_per_frame = Audio_Source.sample_rate // frames_per_second
+
+
+class Keyword_Spotter:
+    """Incremental keyword spotting over one stream with a kws decoder
+
+    Detections are dicts with times in seconds from the start of the
+    stream. The utterance restarts after every detection so the same
+    keyword can fire again"""
+
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.samples_fed = 0
+        self.utt_start_frame = 0
+        self.in_utt = False
+        self._start_utt()
+
+    def process(self, buf):
+        """Feeds buf, returns any new detections"""
+
+        self.decoder.process_raw(buf, False, False)
+        self.samples_fed += len(buf) // Audio_Source.sample_width
+        if self.decoder.hyp() is None:
+            return []
+        detections = self._detections()
+        self._end_utt()
+        self.utt_start_frame = self.samples_fed // samples_per_frame
+        self._start_utt()
+        return detections
+
+    def finish(self):
+        """Ends the utterance, returns detections from the final flush"""
+
+        self._end_utt()
+        if self.decoder.hyp() is None:
+            return []
+        return self._detections()
+
+    def close(self):
+        """Ends the utterance if an error left it open
+
+        So the decoder can start the next stream's"""
+
+        if not self.in_utt:
+            return
+        try:
+            self._end_utt()
+        except Exception:
+            logging.exception("Couldn't end the utterance")
+
+    def _start_utt(self):
+        self.decoder.start_utt()
+        self.in_utt = True
+
+    def _end_utt(self):
+        # Cleared first so a failed end_utt isn't retried by close
+        self.in_utt = False
+        self.decoder.end_utt()
+
+    def _detections(self):
+        return [{"keyword": seg.word.lower(),
+                 "start": (self.utt_start_frame + seg.start_frame)
+                 / frames_per_second,
+                 "end": (self.utt_start_frame + seg.end_frame)
+                 / frames_per_second,
+                 "prob": seg.prob}
+                for seg in self.decoder.seg()]
+
+    @property
+    def audio_seconds(self):
+        return self.samples_fed / Audio_Source.sample_rate
+
+
+def spot_keywords(decoder, audio_source):
+    """Feeds all of audio_source through a kws decoder
+
+    Returns the list of detections"""
+
+    spotter = Keyword_Spotter(decoder)
+    detections = []
+    try:
+        for buf in audio_source:
+            detections.extend(spotter.process(buf))
+        detections.extend(spotter.finish())
+    finally:
+        spotter.close()
+    return detections
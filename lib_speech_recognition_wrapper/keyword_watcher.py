@@ -0,0 +1,49 @@
+import logging
+import os
+import threading
+
+from . import language_dict
+
+
+class Keyword_Watcher(threading.Thread):
+    """Polls a kws list file and calls on_change(keywords_dict) on edits
+
+    The file has the kws list format, one "GO TO SCHOOL /1e-10/" per
+    line. Polling the mtime is cheap and works on every filesystem"""
+
+    def __init__(self, path, on_change, interval=1.0):
+        super().__init__(daemon=True)
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.reloads = 0
+        self.errors = 0
+        self._mtime = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.poll()
+            self._stop_event.wait(self.interval)
+
+    def poll(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        # Also loads on the first poll
+        self._mtime = mtime
+        try:
+            with open(self.path, "r") as f:
+                keywords_dict = language_dict.parse_keywords_list(f.read())
+            self.on_change(keywords_dict)
+            self.reloads += 1
+        except ValueError as e:
+            # Bad edits keep the old keywords
+            self.errors += 1
+            logging.warning(f"Not reloading {self.path}: {e}")
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+# Filtered dicts and kws lists live here named by a hash of their inputs
+cache_dir = "/tmp/lib_speech_recognition_wrapper"
+
+
+def base_word(entry):
+    """blackboard(2) -> blackboard"""
+
+    return entry.partition("(")[0]
+
+
+def dict_fingerprint(source_path,
+                     removed_words,
+                     keywords_dict,
+                     compact_words=None):
+    """Hash of the inputs of a filtered dict
+
+    Uses the source's mtime and size rather than its contents so that
+    checking the cache never reads the 135k line source"""
+
+    stat = os.stat(source_path)
+    key = [os.path.abspath(source_path),
+           stat.st_mtime_ns,
+           stat.st_size,
+           sorted(set(removed_words)),
+           sorted(keywords_dict.items()),
+           sorted(compact_words) if compact_words is not None else None]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()[:16]
+
+
+def cached_dict_path(source_path,
+                     removed_words,
+                     keywords_dict,
+                     compact_words=None):
+    """Returns a dict path with removed_words filtered out
+
+    If compact_words is given only those words (and their word(2)
+    variants) are kept, and ValueError is raised if any are missing
+    from the source. Only rebuilds when one of the inputs changed"""
+
+    if not removed_words and compact_words is None:
+        # Nothing to filter, the decoder can load the source directly
+        return source_path
+
+    fingerprint = dict_fingerprint(source_path,
+                                   removed_words,
+                                   keywords_dict,
+                                   compact_words)
+    path = os.path.join(cache_dir, f"en.{fingerprint}.dict")
+    if not os.path.exists(path):
+        logging.debug(f"Writing new dict {path}")
+        os.makedirs(cache_dir, exist_ok=True)
+        filter_dict(source_path, path, *dict_filter(removed_words,
+                                                    compact_words))
+    return path
+
+
+def in_memory_dict_path(source_path, removed_words, compact_words=None):
+    """Like cached_dict_path but the dict is never written to disk
+
+    Returns (file, path), see in_memory_file"""
+
+    if not removed_words and compact_words is None:
+        return None, source_path
+    f, path = in_memory_file("dict")
+    write_filtered(source_path, f, *dict_filter(removed_words, compact_words))
+    f.flush()
+    return f, path
+
+
+def dict_filter(removed_words, compact_words=None):
+    """Returns the keep and required args of filter_dict"""
+
+    removed_words = set(removed_words)
+    if compact_words is None:
+        return (lambda x: x not in removed_words), ()
+    words = set(compact_words) - removed_words
+    return words.__contains__, words
+
+
+def filter_dict(source_path, dest_path, keep, required=()):
+    """Streams source_path to dest_path keeping lines where keep(word)
+
+    Written to a temp file then renamed so that a decoder loading
+    dest_path in another process never sees a partial file. Raises
+    ValueError without writing dest_path if any required word is absent"""
+
+    tmp_path = _tmp_path(dest_path)
+    try:
+        with open(tmp_path, "w") as dest:
+            write_filtered(source_path, dest, keep, required)
+    except ValueError:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, dest_path)
+
+
+def write_filtered(source_path, dest, keep, required=()):
+    """Writes the lines of source_path where keep(word) to the file dest"""
+
+    kept = set()
+    with open(source_path, "r") as src:
+        for line in src:
+            word = base_word(line[:line.find(" ")])
+            if keep(word):
+                kept.add(word)
+                dest.write(line)
+    missing = set(required) - kept
+    if missing:
+        raise ValueError(f"Words not in {source_path}: {sorted(missing)}")
+
+
+def keywords_list(keywords_dict):
+    """kws list lines, "GO TO SCHOOL /1e-10/" """
+
+    return "".join(f"{keyword.upper()} /1e{multiplier}/\n"
+                   for keyword, multiplier in keywords_dict.items())
+
+
+def parse_keywords_list(text):
+    """Inverse of keywords_list, raises ValueError on bad lines"""
+
+    keywords_dict = dict()
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = re.fullmatch(r"\s*(.+?)\s*/1e(-?\d+(?:\.\d+)?)/\s*", line)
+        if match is None:
+            raise ValueError(f"Bad kws list line: {line!r}")
+        threshold = float(match.group(2))
+        keywords_dict[match.group(1).lower()] = (int(threshold)
+                                                 if threshold.is_integer()
+                                                 else threshold)
+    return keywords_dict
+
+
+def pronunciations(source_path, words):
+    """Dict lines of words and their word(2) variants, entry -> phones
+
+    Raises ValueError if any word isn't in source_path"""
+
+    words = set(words)
+    found = dict()
+    with open(source_path, "r") as f:
+        for line in f:
+            entry, _, phones = line.rstrip("\n").partition(" ")
+            if base_word(entry) in words:
+                found[entry] = phones.strip()
+    missing = words - {base_word(x) for x in found}
+    if missing:
+        raise ValueError(f"Words not in {source_path}: {sorted(missing)}")
+    return found
+
+
+def cached_keywords_paths(keywords_dict):
+    """Returns the (kws list, corpus) paths of keywords_dict
+
+    Named by a hash of keywords_dict so that recognizers with the same
+    keywords share one read only copy, and ones with different keywords
+    never overwrite each other's. Only written if missing"""
+
+    key = json.dumps(list(keywords_dict.items()))
+    fingerprint = hashlib.sha256(key.encode()).hexdigest()[:16]
+    kws_path = os.path.join(cache_dir, f"kws.{fingerprint}.list")
+    corpus_path = os.path.join(cache_dir, f"corpus.{fingerprint}.txt")
+    for path, text in [(kws_path, keywords_list(keywords_dict)),
+                       (corpus_path, "".join(x + "\n" for x in keywords_dict))]:
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            atomic_write(path, text)
+    return kws_path, corpus_path
+
+
+def atomic_write(path, text):
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _tmp_path(path):
+    # Unique per thread too, recognizers can start in parallel threads
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def in_memory_file(name):
+    """Returns (file, path) of an anonymous file that lives in memory
+
+    For decoder options that only take a path. The path is only valid
+    while file is open, so keep a reference to it. Needs memfd_create,
+    which is Linux only"""
+
+    if not hasattr(os, "memfd_create"):
+        raise OSError("In memory files need os.memfd_create")
+    fd = os.memfd_create(name)
+    return os.fdopen(fd, "w"), f"/proc/self/fd/{fd}"
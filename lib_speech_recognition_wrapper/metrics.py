@@ -0,0 +1,210 @@
+import bisect
+from collections import defaultdict
+import json
+import logging
+import threading
+
+
+class Latency_Histogram:
+    """Bucketed histogram of durations in seconds"""
+
+    default_buckets = (.001, .0025, .005, .01, .025, .05, .1,
+                       .25, .5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(buckets)
+        # Last bucket is everything above the largest bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the qth quantile"""
+
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def as_dict(self):
+        return {"count": self.count,
+                "sum": self.sum,
+                "mean": self.mean,
+                "max": self.max,
+                "p50": self.quantile(.5),
+                "p90": self.quantile(.9),
+                "p99": self.quantile(.99),
+                "buckets": dict(zip([str(x) for x in self.buckets] + ["+Inf"],
+                                    self.counts))}
+
+
+class Metrics:
+    """Counters and latency histograms for the recognition loop
+
+    Hooks are called as hook(kind, name, value, labels) on every update
+    so they can forward to any backend. Collectors are called at export
+    time and return a {name: number} dict of gauges, which is how
+    component stats (ring buffer, decoder pool, ...) are exported
+    without touching the hot path. Disabled code paths check for
+    metrics is None, so there's nothing to pay when it's off"""
+
+    prefix = "speech_"
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.hooks = []
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+        for hook in self.hooks:
+            hook("counter", name, value, labels)
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key,
+                                                       Latency_Histogram())
+        histogram.observe(seconds)
+        for hook in self.hooks:
+            hook("histogram", name, seconds, labels)
+
+    def gauges(self):
+        gauges = {}
+        for collector in self.collectors:
+            try:
+                gauges.update(collector())
+            except Exception as e:
+                logging.debug(f"Metrics collector failed: {e}")
+        return gauges
+
+    def to_json(self):
+        return {"counters": [{"name": name, "labels": dict(labels), "value": v}
+                             for (name, labels), v in self.counters.items()],
+                "histograms": [{"name": name,
+                                "labels": dict(labels),
+                                **histogram.as_dict()}
+                               for (name, labels), histogram
+                               in self.histograms.items()],
+                "gauges": self.gauges()}
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+
+        lines = []
+        typed = set()
+
+        def type_line(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            name = self.prefix + name
+            type_line(name, "counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items(),
+                                                key=lambda x: x[0]):
+            name = self.prefix + name
+            type_line(name, "histogram")
+            cumulative = 0
+            bounds = [str(x) for x in histogram.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                bucket_labels = labels + (("le", bound),)
+                lines.append(f"{name}_bucket{self._labels(bucket_labels)} "
+                             f"{cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{self._labels(labels)} "
+                         f"{histogram.count}")
+        for name, value in sorted(self.gauges().items()):
+            name = self.prefix + name
+            type_line(name, "gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"')
+                   for _, v in labels)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v
+                              in zip(labels, escaped)) + "}"
+
+
+class Metrics_Exporter:
+    """Serves a Metrics on localhost
+
+    /metrics is Prometheus text and /metrics.json is JSON"""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        # Lazy since most processes never serve metrics
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics_ = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = metrics_.to_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(metrics_.to_json()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logging.info(f"Metrics on http://{self.server.server_address[0]}:"
+                     f"{self.server.server_address[1]}/metrics")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,149 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
+import json
+import logging
+import os
+from time import perf_counter
+
+
+class Stage:
+    """One step of a Pipeline
+
+    inputs are paths whose size and mtime make up the stage's
+    fingerprint along with params, outputs are paths that must exist
+    for the stage to count as done"""
+
+    def __init__(self, func, deps=(), inputs=(), outputs=(), params=()):
+        self.func = func
+        self.name = func.__name__
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = list(params)
+
+    def fingerprint(self):
+        values = [self.params]
+        for path in self.inputs:
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in sorted(os.walk(path)):
+                    for fname in sorted(filenames):
+                        values.append(self._stat(os.path.join(dirpath, fname)))
+            else:
+                values.append(self._stat(path))
+        return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+    @staticmethod
+    def _stat(path):
+        if not os.path.exists(path):
+            return [path, None]
+        stat = os.stat(path)
+        return [path, stat.st_size, stat.st_mtime_ns]
+
+
+class Pipeline:
+    """Runs stages in dependency order, resuming from where it stopped
+
+    A completion marker holding the stage's input fingerprint is written
+    after each stage succeeds. A stage is skipped when its marker
+    matches, its outputs exist and none of its deps ran, so a failed
+    run picks up at the first incomplete or stale stage. Stages whose
+    deps are done run concurrently on up to workers threads"""
+
+    def __init__(self, stages, marker_dir, workers=4):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dep in stage.deps:
+                assert dep in self.stages, f"{stage.name} needs unknown {dep}"
+        self.marker_dir = marker_dir
+        self.workers = workers
+        # name -> wall clock seconds, None if it was skipped
+        self.stage_seconds = dict()
+
+    def run(self, rerun=()):
+        """Runs every stale stage, and those named in rerun"""
+
+        self.stage_seconds = dict()
+        ran = set()
+        pending = dict(self.stages)
+        running = dict()
+        error = None
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                progressed = False
+                for name, stage in list(pending.items()):
+                    if error is not None:
+                        break
+                    if not all(dep in self.stage_seconds for dep in stage.deps):
+                        continue
+                    del pending[name]
+                    progressed = True
+                    if (name not in rerun
+                            and not ran.intersection(stage.deps)
+                            and self.is_done(stage)):
+                        logging.info(f"Skipping {name}, already done")
+                        self.stage_seconds[name] = None
+                        continue
+                    logging.info(f"In {name}")
+                    fingerprint = stage.fingerprint()
+                    future = executor.submit(self._timed, stage.func)
+                    running[future] = (stage, fingerprint)
+                if not running:
+                    if error is None and pending and not progressed:
+                        error = ValueError("Dependency cycle in "
+                                           f"{list(pending)}")
+                    if error is not None or not pending:
+                        break
+                    # Skipped stages may have made others ready
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, fingerprint = running.pop(future)
+                    try:
+                        seconds = future.result()
+                    except Exception as e:
+                        logging.error(f"{stage.name} failed: {e}")
+                        error = error or e
+                        continue
+                    self.write_marker(stage, fingerprint)
+                    self.stage_seconds[stage.name] = seconds
+                    ran.add(stage.name)
+                    logging.info(f"{stage.name} took {seconds:.1f}s")
+        self.log_report()
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def _timed(func):
+        start = perf_counter()
+        func()
+        return perf_counter() - start
+
+    def is_done(self, stage):
+        if not all(os.path.exists(x) for x in stage.outputs):
+            return False
+        try:
+            with open(self.marker_path(stage), "r") as f:
+                return json.load(f)["fingerprint"] == stage.fingerprint()
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def write_marker(self, stage, fingerprint):
+        os.makedirs(self.marker_dir, exist_ok=True)
+        tmp_path = self.marker_path(stage) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fingerprint": fingerprint}, f)
+        os.replace(tmp_path, self.marker_path(stage))
+
+    def marker_path(self, stage):
+        return os.path.join(self.marker_dir, stage.name + ".json")
+
+    def log_report(self):
+        for name in self.stages:
+            seconds = self.stage_seconds.get(name, "not run")
+            if seconds is None:
+                seconds = "skipped"
+            elif not isinstance(seconds, str):
+                seconds = f"{seconds:.1f}s"
+            logging.info(f"{name:<22} {seconds:>10}")
+        total = sum(x for x in self.stage_seconds.values() if x is not None)
+        logging.info(f"{'total':<22} {total:>9.1f}s")
@@ -0,0 +1,22 @@
+import resource
+import sys
+
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2**20
+    except OSError:
+        # No procfs, peak is the best that's available
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
@@ -0,0 +1,153 @@
+import logging
+import threading
+
+from .audio_sources import Audio_Source
+
+
+class Ring_Buffer:
+    """Fixed size byte FIFO between one writer and one reader thread
+
+    Storage is allocated once. When a write doesn't fit, the oldest
+    audio is dropped since the newest is what matters for live decoding"""
+
+    def __init__(self, size):
+        self.size = size
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._read_pos = 0
+        self._depth = 0
+        self._cond = threading.Condition()
+        self.closed = False
+        # Metrics for sizing the buffer
+        self.overflows = 0
+        self.overflowed_bytes = 0
+        self.max_depth = 0
+        self.bytes_written = 0
+
+    @property
+    def depth(self):
+        """Bytes waiting to be read"""
+
+        return self._depth
+
+    def write(self, data):
+        data = memoryview(data)
+        with self._cond:
+            # Counted as one overflow however much of it didn't fit
+            dropped = 0
+            if len(data) > self.size:
+                dropped += len(data) - self.size
+                data = data[-self.size:]
+            free = self.size - self._depth
+            if len(data) > free:
+                dropped += len(data) - free
+                # Make room by discarding the oldest unread bytes
+                self._read_pos = (self._read_pos + len(data) - free) % self.size
+                self._depth -= len(data) - free
+            if dropped:
+                self._drop(dropped)
+            write_pos = (self._read_pos + self._depth) % self.size
+            first = min(len(data), self.size - write_pos)
+            self._view[write_pos:write_pos + first] = data[:first]
+            self._view[:len(data) - first] = data[first:]
+            self._depth += len(data)
+            self.bytes_written += len(data)
+            self.max_depth = max(self.max_depth, self._depth)
+            self._cond.notify()
+
+    def _drop(self, num_bytes):
+        self.overflows += 1
+        self.overflowed_bytes += num_bytes
+
+    def read(self, num_bytes, timeout=None):
+        """Blocks until num_bytes are available or the buffer is closed
+
+        Returns b"" once closed and drained"""
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._depth >= num_bytes or self.closed,
+                                timeout)
+            num_bytes = min(num_bytes, self._depth)
+            first = min(num_bytes, self.size - self._read_pos)
+            buf = (bytes(self._view[self._read_pos:self._read_pos + first])
+                   + bytes(self._view[:num_bytes - first]))
+            self._read_pos = (self._read_pos + num_bytes) % self.size
+            self._depth -= num_bytes
+            return buf
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    @property
+    def stats(self):
+        return {"depth": self._depth,
+                "max_depth": self.max_depth,
+                "size": self.size,
+                "overflows": self.overflows,
+                "overflowed_bytes": self.overflowed_bytes,
+                "bytes_written": self.bytes_written}
+
+
+class Capture_Thread(threading.Thread):
+    """Reads from a (live) audio source into a Ring_Buffer"""
+
+    def __init__(self, audio_source, ring_buffer):
+        super().__init__(daemon=True)
+        self.audio_source = audio_source
+        self.ring_buffer = ring_buffer
+        self.source_overflows = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        chunk_size = self.audio_source.chunk_size
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    buf = self.audio_source.read(chunk_size)
+                except IOError as e:
+                    # PyAudio's input overflowed, audio already lost
+                    self.source_overflows += 1
+                    logging.debug(f"Capture overflow: {e}")
+                    continue
+                if not buf:
+                    break
+                self.ring_buffer.write(buf)
+        finally:
+            self.ring_buffer.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class Buffered_Audio_Source(Audio_Source):
+    """Captures another source on its own thread so decoding never blocks it
+
+    Audio that arrives while the decoder or a callback is busy waits
+    in the ring buffer rather than overflowing PyAudio"""
+
+    def __init__(self, audio_source, buffer_seconds=10):
+        self.audio_source = audio_source
+        self.chunk_size = audio_source.chunk_size
+        size = int(buffer_seconds * self.sample_rate) * self.sample_width
+        self.ring_buffer = Ring_Buffer(size)
+        self.capture_thread = Capture_Thread(audio_source, self.ring_buffer)
+        self.capture_thread.start()
+
+    def read(self, num_frames):
+        return self.ring_buffer.read(num_frames * self.sample_width)
+
+    @property
+    def stats(self):
+        """Buffer depth and overflow counts"""
+
+        stats = self.ring_buffer.stats
+        stats["source_overflows"] = self.capture_thread.source_overflows
+        return stats
+
+    def close(self):
+        self.capture_thread.stop()
+        self.capture_thread.join(timeout=1)
+        self.audio_source.close()
+        self.ring_buffer.close()
@@ -0,0 +1,218 @@
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import logging
+import threading
+
+
+class One_Shot_Schedule:
+    """Fires once at when"""
+
+    def __init__(self, when):
+        self.when = when
+
+    def next_fire(self, after):
+        return self.when if self.when > after else None
+
+
+class Interval_Schedule:
+    """Fires every interval (seconds or timedelta), starting at start"""
+
+    def __init__(self, interval, start=None):
+        if not isinstance(interval, timedelta):
+            interval = timedelta(seconds=interval)
+        if interval <= timedelta(0):
+            raise ValueError("interval must be positive")
+        self.interval = interval
+        self.start = start or datetime.now()
+
+    def next_fire(self, after):
+        if after < self.start:
+            return self.start
+        periods = (after - self.start) // self.interval + 1
+        return self.start + periods * self.interval
+
+
+class Cron_Schedule:
+    """Five field cron expression: minute hour day month weekday
+
+    Fields accept *, numbers, a-b ranges, a,b lists and /n steps.
+    Weekday 0 and 7 are Sunday. As in cron, when both day and weekday
+    are restricted either one matching is enough"""
+
+    field_ranges = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.expression = expression
+        (self.minutes,
+         self.hours,
+         self.days,
+         self.months,
+         weekdays) = [self._parse(field, *bounds) for field, bounds
+                      in zip(fields, self.field_ranges)]
+        # 7 is also Sunday, and python weekdays start on Monday
+        self.weekdays = {(x - 1) % 7 for x in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            step = int(step) if step else 1
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(x) for x in part.split("-"))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if not low <= start <= end <= high:
+                raise ValueError(f"{field} is out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, t):
+        day = t.day in self.days
+        weekday = t.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_fire(self, after):
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Jumps by month/day/hour so this never walks minute by minute
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0)
+                     + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        return None
+
+
+def make_schedule(key):
+    """callback_time_dict keys to schedules
+
+    A datetime fires once, a timedelta repeats and a str is cron"""
+
+    if isinstance(key, datetime):
+        return One_Shot_Schedule(key)
+    elif isinstance(key, timedelta):
+        return Interval_Schedule(key)
+    elif isinstance(key, str):
+        return Cron_Schedule(key)
+    elif hasattr(key, "next_fire"):
+        return key
+    raise TypeError(f"Can't schedule {key!r}")
+
+
+class Scheduler:
+    """Heap of next fire times on a thread that sleeps until one is due
+
+    Due callbacks are handed to the Callback_Dispatcher. If the thread
+    wakes more than misfire_grace seconds late (suspend, clock change,
+    overloaded box), misfire_policy decides what happens to missed
+    fires: fire_once fires one time, fire_all fires every missed
+    time and skip fires nothing. All of them then continue from now"""
+
+    misfire_policies = ("fire_once", "fire_all", "skip")
+
+    def __init__(self,
+                 callback_dispatcher,
+                 misfire_policy="fire_once",
+                 misfire_grace=60):
+        if misfire_policy not in self.misfire_policies:
+            raise ValueError(f"misfire_policy must be one of "
+                             f"{self.misfire_policies}")
+        self.callback_dispatcher = callback_dispatcher
+        self.misfire_policy = misfire_policy
+        self.misfire_grace = timedelta(seconds=misfire_grace)
+        self._heap = []
+        # Tie breaker so jobs themselves are never compared
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.fired = 0
+        self.missed = 0
+
+    def add(self, key, callback):
+        """Schedules callback, see make_schedule for what key can be"""
+
+        schedule = make_schedule(key)
+        with self._cond:
+            self._push(key, schedule, callback, datetime.now())
+            self._cond.notify()
+
+    def _push(self, key, schedule, callback, after):
+        fire_time = schedule.next_fire(after)
+        if fire_time is not None:
+            heapq.heappush(self._heap, (fire_time,
+                                        next(self._counter),
+                                        key,
+                                        schedule,
+                                        callback))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                now = datetime.now()
+                fire_time = self._heap[0][0]
+                if fire_time > now:
+                    self._cond.wait((fire_time - now).total_seconds())
+                    continue
+                _, _, key, schedule, callback = heapq.heappop(self._heap)
+                self._fire(key, schedule, callback, fire_time, now)
+
+    def _fire(self, key, schedule, callback, fire_time, now):
+        if now - fire_time <= self.misfire_grace:
+            self._submit(key, callback)
+            self._push(key, schedule, callback, fire_time)
+            return
+
+        # Woke up late, count everything that was missed
+        missed = 1
+        next_time = schedule.next_fire(fire_time)
+        while next_time is not None and next_time <= now:
+            missed += 1
+            next_time = schedule.next_fire(next_time)
+        logging.warning(f"Scheduled callback {key} missed {missed} times")
+        self.missed += missed
+        if self.misfire_policy == "fire_once":
+            self._submit(key, callback)
+        elif self.misfire_policy == "fire_all":
+            for _ in range(missed):
+                self._submit(key, callback)
+        self._push(key, schedule, callback, now)
+
+    def _submit(self, key, callback):
+        self.fired += 1
+        self.callback_dispatcher.submit(key, callback)
@@ -0,0 +1,275 @@
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+from time import perf_counter, process_time
+
+from .audio_sources import Audio_Source
+from .decoder_pool import Decoder_Pool
+from .keyword_spotter import Keyword_Spotter
+from .metrics import Latency_Histogram
+from .speech_recognition_wrapper import Speech_Recognition_Wrapper
+
+
+def _decode_worker(requests, results, wrapper_kwargs, max_decoders):
+    """Owns the decoders of every stream pinned to this process"""
+
+    try:
+        # Finds the kws list and dict the parent cached
+        wrapper = Speech_Recognition_Wrapper(**wrapper_kwargs)
+    except Exception:
+        # The server sees the exit and fails this worker's streams
+        logging.exception("Decode worker couldn't start")
+        return
+    # Decoders of closed streams are reused by new ones
+    decoder_pool = Decoder_Pool(max_decoders=max_decoders)
+    spotters = {}
+    while True:
+        msg = requests.get()
+        if msg is None:
+            logging.info(f"Worker decoder pool: {decoder_pool.stats}")
+            break
+        kind, stream_id, seq, buf = msg
+        start = process_time()
+        try:
+            if kind == "open":
+                decoder = decoder_pool.acquire(wrapper.config)
+                spotters[stream_id] = Keyword_Spotter(decoder)
+                detections = []
+            elif kind == "audio":
+                detections = spotters[stream_id].process(buf)
+            else:
+                spotter = spotters.pop(stream_id)
+                detections = spotter.finish()
+                decoder_pool.release(spotter.decoder)
+            error = None
+        except Exception as e:
+            detections, error = [], str(e)
+        results.put((stream_id, seq, detections, error, process_time() - start))
+
+
+class Recognition_Server:
+    """Keyword spotting for many PCM streams over TCP or Unix sockets
+
+    Clients send raw 16 kHz mono int16 PCM and get back one JSON line
+    per detection. Each stream is pinned to one of workers decoder
+    processes, which holds that stream's Decoder, so decoding uses
+    every core while the asyncio loop only moves bytes. A worker that
+    dies fails its streams and gets no new ones"""
+
+    def __init__(self,
+                 keywords_dict=None,
+                 removed_words=[],
+                 dict_mode="full",
+                 workers=None,
+                 chunk_size=4096,
+                 max_decoders_per_worker=32,
+                 liveness_interval=1.0):
+        self.wrapper_kwargs = {"keywords_dict": keywords_dict,
+                               "removed_words": removed_words,
+                               "dict_mode": dict_mode}
+        # Caches the kws list and dict before the workers look them up
+        Speech_Recognition_Wrapper(**self.wrapper_kwargs)
+        self.num_workers = workers or multiprocessing.cpu_count()
+        self.max_decoders_per_worker = max_decoders_per_worker
+        self.liveness_interval = liveness_interval
+        self.chunk_bytes = chunk_size * Audio_Source.sample_width
+        self._stream_ids = itertools.count()
+        self._futures = {}
+        self.workers = []
+        # Metrics
+        self.streams_total = 0
+        self.streams_active = 0
+        self.audio_seconds = 0
+        self.cpu_seconds = 0
+        self.detections = 0
+        self.latency = Latency_Histogram()
+
+    def run(self, address):
+        """Serves until interrupted. address is host:port or a unix path"""
+
+        asyncio.run(self.serve(address))
+
+    async def serve(self, address):
+        self.loop = asyncio.get_running_loop()
+        self.start_workers()
+        if ":" in address and not address.startswith("/"):
+            host, port = address.rsplit(":", 1)
+            server = await asyncio.start_server(self.handle, host, int(port))
+        else:
+            server = await asyncio.start_unix_server(self.handle, address)
+        logging.info(f"Serving on {address} with {self.num_workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop_workers()
+            logging.info(f"Server stats: {self.stats}")
+
+    def start_workers(self):
+        self.results = multiprocessing.Queue()
+        for _ in range(self.num_workers):
+            requests = multiprocessing.Queue()
+            args = (requests,
+                    self.results,
+                    self.wrapper_kwargs,
+                    self.max_decoders_per_worker)
+            process = multiprocessing.Process(target=_decode_worker,
+                                              args=args,
+                                              daemon=True)
+            process.start()
+            # [request queue, process, number of streams, alive]
+            self.workers.append([requests, process, 0, True])
+        self._results_thread = threading.Thread(target=self._read_results,
+                                                daemon=True)
+        self._results_thread.start()
+
+    def stop_workers(self):
+        for requests, process, _, alive in self.workers:
+            if alive:
+                requests.put(None)
+            process.join()
+        self.results.put(None)
+        self.workers = []
+
+    def _read_results(self):
+        """Hands worker replies back to the coroutines awaiting them
+
+        Also checks every liveness_interval that the workers are alive,
+        since a dead one never replies"""
+
+        last_check = perf_counter()
+        while True:
+            try:
+                msg = self.results.get(timeout=self.liveness_interval)
+            except queue.Empty:
+                msg = ()
+            if perf_counter() - last_check >= self.liveness_interval:
+                last_check = perf_counter()
+                for worker in self.workers:
+                    if worker[3] and not worker[1].is_alive():
+                        self.loop.call_soon_threadsafe(self._fail_worker,
+                                                       worker)
+            if msg is None:
+                break
+            if not msg:
+                continue
+            stream_id, seq, detections, error, cpu_seconds = msg
+            future, _ = self._futures.pop((stream_id, seq), (None, None))
+            if future is not None:
+                self.loop.call_soon_threadsafe(self._resolve,
+                                               future,
+                                               (detections,
+                                                error,
+                                                cpu_seconds))
+
+    def _fail_worker(self, worker):
+        """Fails the requests of a dead worker, run on the event loop"""
+
+        if not worker[3]:
+            return
+        worker[3] = False
+        error = f"Decode worker exited with code {worker[1].exitcode}"
+        logging.error(error)
+        for key, (future, _worker) in list(self._futures.items()):
+            # The results thread may have just popped it
+            if _worker is worker and self._futures.pop(key, None):
+                self._resolve(future, ([], error, 0))
+
+    @staticmethod
+    def _resolve(future, result):
+        # Streams that were cancelled or already failed aren't waiting
+        if not future.done():
+            future.set_result(result)
+
+    async def _request(self, worker, kind, stream_id, seq, buf=None):
+        if not worker[3]:
+            raise RuntimeError(f"Stream {stream_id}: its worker died")
+        future = self.loop.create_future()
+        self._futures[(stream_id, seq)] = (future, worker)
+        worker[0].put((kind, stream_id, seq, buf))
+        detections, error, cpu_seconds = await future
+        self.cpu_seconds += cpu_seconds
+        if error is not None:
+            raise RuntimeError(f"Stream {stream_id}: {error}")
+        return detections
+
+    async def handle(self, reader, writer):
+        stream_id = next(self._stream_ids)
+        alive = [x for x in self.workers if x[3]]
+        if not alive:
+            logging.error(f"Stream {stream_id} refused, no workers alive")
+            writer.close()
+            return
+        # Least loaded worker gets the new stream
+        worker = min(alive, key=lambda x: x[2])
+        worker[2] += 1
+        self.streams_total += 1
+        self.streams_active += 1
+        seq = itertools.count()
+        latency = Latency_Histogram()
+        opened = closed = False
+        try:
+            await self._request(worker, "open", stream_id, next(seq))
+            opened = True
+            while True:
+                try:
+                    buf = await reader.readexactly(self.chunk_bytes)
+                except asyncio.IncompleteReadError as e:
+                    buf = e.partial
+                if not buf:
+                    break
+                received = perf_counter()
+                detections = await self._request(worker,
+                                                 "audio",
+                                                 stream_id,
+                                                 next(seq),
+                                                 buf)
+                chunk_latency = perf_counter() - received
+                latency.observe(chunk_latency)
+                self.latency.observe(chunk_latency)
+                self.audio_seconds += (len(buf) / Audio_Source.sample_width
+                                       / Audio_Source.sample_rate)
+                await self._send(writer, stream_id, detections, chunk_latency)
+                if len(buf) < self.chunk_bytes:
+                    break
+            closed = True
+            detections = await self._request(worker,
+                                             "close",
+                                             stream_id,
+                                             next(seq))
+            await self._send(writer, stream_id, detections, None)
+        except (ConnectionError, RuntimeError) as e:
+            logging.warning(f"Stream {stream_id} ended: {e}")
+        finally:
+            if opened and not closed and worker[3]:
+                # Frees the decoder, nobody waits on the reply
+                worker[0].put(("close", stream_id, next(seq), None))
+            worker[2] -= 1
+            self.streams_active -= 1
+            writer.close()
+            logging.info(f"Stream {stream_id} latency: {latency.as_dict()}")
+
+    async def _send(self, writer, stream_id, detections, chunk_latency):
+        for detection in detections:
+            self.detections += 1
+            event = dict(detection, stream=stream_id, latency=chunk_latency)
+            writer.write(json.dumps(event).encode() + b"\n")
+        await writer.drain()
+
+    @property
+    def stats(self):
+        """realtime_factor_per_core is audio seconds decoded per CPU second"""
+
+        return {"streams_active": self.streams_active,
+                "streams_total": self.streams_total,
+                "detections": self.detections,
+                "audio_seconds": self.audio_seconds,
+                "decode_cpu_seconds": self.cpu_seconds,
+                "realtime_factor_per_core": (self.audio_seconds
+                                             / self.cpu_seconds
+                                             if self.cpu_seconds else None),
+                "latency": self.latency.as_dict()}
@@ -1,26 +1,27 @@
-from datetime import datetime
 import itertools
 import logging
 import os
 import re
-import sys
-import time
-from time import perf_counter
+import threading
+from time import perf_counter, process_time
 
-import pyaudio
+from .audio_sources import Audio_Source, Microphone_Audio_Source
+from .callback_dispatcher import Callback_Dispatcher
+from .decoder_pool import default_decoder_pool
+from .defaults import default_keywords_dict, tuned_path
+from .endpointing import Endpointer
+from .keyword_matcher import Keyword_Matcher
+from .keyword_watcher import Keyword_Watcher
+from . import language_dict
+from .metrics import Latency_Histogram, Metrics, Metrics_Exporter
+from .ring_buffer import Buffered_Audio_Source
+from .scheduler import Scheduler
 
-from .audio_tuner import Audio_Tuner
-from .defaults import default_keywords_dict
-
-from pocketsphinx import DefaultConfig, Decoder, get_model_path, get_data_path
+from pocketsphinx import DefaultConfig, get_model_path, get_data_path
 
 
 class Speech_Recognition_Wrapper:
 
-    corpus_path = "/tmp/corpus.txt"
-    keywords_path = "/tmp/kws.list"
-    dict_path = "/tmp/en.dict"
-
     def __init__(self,
                  keywords_dict=None,
                  redownload=True,
@@ -30,10 +31,45 @@ class Speech_Recognition_Wrapper:
                  tuning_phrases=[],
                  test=False,
                  train=False,
-                 quiet=False):
-        """Saves and if redownload then writes keywords"""
+                 quiet=False,
+                 dict_mode="full",
+                 callback_concurrency=2,
+                 callback_queue_size=8,
+                 callback_timeout=None,
+                 callback_policy="coalesce",
+                 misfire_policy="fire_once",
+                 endpoint_silence_seconds=0,
+                 max_utterance_seconds=10,
+                 vad=False,
+                 decoder_pool=None,
+                 metrics=None,
+                 metrics_port=None,
+                 in_memory=False):
+        """Saves and writes keywords
+
+        The kws list and dict are shared by every recognizer with the same
+        config and written atomically, so recognizers can start in
+        parallel. in_memory keeps them in memory files instead (Linux).
+        Their /proc/self/fd paths only work in this process, so the
+        config can't be handed to worker processes, which have to build
+        their own recognizer.
+
+        dict_mode compact loads only keyword pronunciations, which makes
+        the decoder much faster to build and smaller in memory.
+        Callbacks run on a Callback_Dispatcher configured by the
+        callback_* args, see it for details. callback_time_dict keys can
+        be a datetime, a timedelta to repeat or a cron str, see Scheduler.
+        Utterances restart at speech boundaries, see Endpointer. vad is
+        True or an Energy_VAD to only feed the decoder during speech.
+        Decoders come from decoder_pool, by default one per process.
+        metrics is True or a Metrics to instrument the recognition loop,
+        served on localhost if metrics_port is given"""
 
         self.quiet = quiet
+        self.dict_mode = dict_mode
+        self.in_memory = in_memory
+        # Open memory files backing the kws list and dict paths
+        self.in_memory_files = []
 
         # model path for pocket sphinx
         self.model_path = get_model_path()
@@ -42,114 +78,124 @@ class Speech_Recognition_Wrapper:
             keywords_dict = default_keywords_dict
         self.keywords_dict = keywords_dict
 
-        if redownload:
-            self.write_keywords()
-            self.write_language_dict(removed_words)
-
-        self.config = self.get_config()
-
         # strings for keys, functions are the values
         self.callbacks_dict = callback_dict
         self.callback_time_dict = callback_time_dict
+        if metrics is None and metrics_port is not None:
+            metrics = True
+        self.metrics = Metrics() if metrics is True else (metrics or None)
+        self.keyword_matcher = Keyword_Matcher(self.callbacks_dict)
+        self.callback_dispatcher = Callback_Dispatcher(
+            concurrency=callback_concurrency,
+            max_pending=callback_queue_size,
+            timeout=callback_timeout,
+            policy=callback_policy,
+            metrics=self.metrics)
+        self.scheduler = Scheduler(self.callback_dispatcher,
+                                   misfire_policy=misfire_policy)
+        for key, callback in self.callback_time_dict.items():
+            self.scheduler.add(key, callback)
+        self.endpointer = Endpointer(
+            silence_seconds=endpoint_silence_seconds,
+            max_utterance_seconds=max_utterance_seconds)
+        self.detection_latency = Latency_Histogram()
+        if vad is True:
+            # Lazy so NumPy is only imported when the VAD is used
+            from .vad import Energy_VAD
+            vad = Energy_VAD()
+        self.vad = vad or None
+        self.decoder_pool = decoder_pool or default_decoder_pool
+        self.audio_source = None
+        # (keywords_dict, callbacks_dict, pronunciations) to swap in at
+        # the next chunk, see set_keywords
+        self._pending_keywords = None
+        self._keywords_lock = threading.Lock()
+        # Name of the swapped in kws search, None for the config's own
+        self._active_search = None
+        self._searches = 0
+        # In memory kws list of the last swap, see write_keywords
+        self._swap_keywords_file = None
+        self.keyword_swap_latency = Latency_Histogram()
+        self.keyword_watcher = None
+        if self.metrics is not None:
+            self.add_metrics_collectors()
+            if metrics_port is not None:
+                Metrics_Exporter(self.metrics, metrics_port).start()
+
+        # Cached kws lists are only written when missing, so redownload
+        # is no longer needed and only kept for old callers
+        self.write_keywords()
+        # Always resolved since it's a cache lookup unless inputs changed
+        self.write_language_dict(removed_words)
+
+        self.config = self.get_config()
 
         if len(tuning_phrases) > 0 and train:
+            # Lazy, the tuner pulls in pathos, lib_utils and its toolchain
+            from .audio_tuner import Audio_Tuner
             Audio_Tuner(tuning_phrases, test=test).run()
 
-    def write_keywords(self):
-        """Writes keywords to their own file"""
-
-        with open(self.keywords_path, "w") as f:
-            with open(self.corpus_path, "w") as f2:
-                for keyword, multiplier in self.keywords_dict.items():
-                    f.write(f"{keyword.upper()} /1e{multiplier}/\n")
-                    #f.write(f"{keyword} /1e{multiplier}/\n")
-                    f2.write(keyword + "\n")
+    def write_keywords(self, swap=False):
+        """Points keywords_path at a kws list of keywords_dict
+
+        In memory, the config's own list stays open for new decoders,
+        while a swap's list is only kept until the next swap since
+        set_kws has read it by then"""
+
+        if self.in_memory:
+            f, self.keywords_path = language_dict.in_memory_file("kws")
+            f.write(language_dict.keywords_list(self.keywords_dict))
+            f.flush()
+            if swap:
+                if self._swap_keywords_file is not None:
+                    self._swap_keywords_file.close()
+                self._swap_keywords_file = f
+            else:
+                self.in_memory_files.append(f)
+            self.corpus_path = None
+        else:
+            self.keywords_path, self.corpus_path = \
+                language_dict.cached_keywords_paths(self.keywords_dict)
         # This makes it worse, idk why
         #input("upload corpus to http://www.speech.cs.cmu.edu/tools/lmtool-new.html")
         #input("Save it in /tmp/knowledge_base.lm")
 
     def write_language_dict(self, words_to_remove):
-        """Writes the language dictionary of the keywords"""
-
-        logging.debug("Writing new dict")
-        with open(os.path.join(self.model_path,
-                               'cmudict-en-us.dict'), "r") as f:
-            lines = list(f.readlines())
-
-        words_to_remove = set(words_to_remove)
-
-        lines_to_keep = []
-
-        for line in lines:
-            first_word = line.split()[0]
-            # Sometimes fmt blackboard(2) <pronounciation>
-            if "(" in first_word:
-                first_word = first_word.split("(")[0]
-            if first_word not in words_to_remove:
-                lines_to_keep.append(line)
-
-        with open(self.dict_path, "w") as f:
-           for line in lines_to_keep:
-               f.write(line)
-        return
-
-
-        """
-        all_words = []
-        for keyword in self.keywords_dict:
-            all_words.extend(keyword.split())
-        all_words = set(all_words)
-
-        word_dict = {}
-        for word in sorted(all_words):
-            word_dict[word] = []
-
-        for line in lines:
-            first_word = line.split(" ")[0]
-            if "(" in first_word:
-                first_word = first_word.split("(")[0]
-            if first_word in all_words:
-                pronounciation = " ".join(line.split()[1:]).replace("\n", "")
-                word_dict[first_word].append(pronounciation)
-
-        with open(self.dict_path, "w") as f:
-            for keyword in self.keywords_dict:
-                pronounciations = []
-                for word in keyword.split():
-                    pronounciations.append(word_dict[word])
-                for i, combo in enumerate(list(itertools.product(*pronounciations))):
-                    line = "-".join(keyword.split())
-                    if i + 1 > 1:
-                        line += f"({i + 1})"
-                    line += " " + " ".join(combo) + "\n"
-                    f.write(line)
-
-
-
-        return
-        """
-        save_lines = []
-
-        all_words = []
-        for keyword in self.keywords_dict:
-            all_words.extend(keyword.split())
-        all_words = set(all_words)
-
-        for line in lines:
-            first_word = line.split(" ")[0]
-            if first_word in all_words or first_word.split("(")[0] in all_words:
-                save_lines.append(line)
-
-        with open(self.dict_path, "w") as f:
-            for line in save_lines:
-                f.write(line)
+        """Points dict_path at a cached dict without words_to_remove
+
+        The cache is keyed on the source dict and the arguments, so it's
+        only rewritten when one of those changes. In compact mode only the
+        words of keywords_dict and callbacks_dict are kept"""
+
+        compact_words = None
+        if self.dict_mode == "compact":
+            compact_words = set()
+            for phrase in itertools.chain(self.keywords_dict,
+                                          self.callbacks_dict):
+                compact_words.update(phrase.lower().split())
+        elif self.dict_mode != "full":
+            raise ValueError(f"dict_mode must be full or compact, "
+                             f"not {self.dict_mode}")
+        source_path = os.path.join(self.model_path, 'cmudict-en-us.dict')
+        if self.in_memory:
+            f, self.dict_path = language_dict.in_memory_dict_path(
+                source_path,
+                words_to_remove,
+                compact_words)
+            if f is not None:
+                self.in_memory_files.append(f)
+        else:
+            self.dict_path = language_dict.cached_dict_path(source_path,
+                                                            words_to_remove,
+                                                            self.keywords_dict,
+                                                            compact_words)
 
     def get_config(self):
         # Create a decoder with a certain model
         config = DefaultConfig()
         #config.set_string('-hmm', os.path.join(self.model_path, 'en-us'))
-        config.set_string('-hmm', os.path.join(Audio_Tuner.tuned_path, 'en-us-adapt'))
-        config.set_string('-lm', os.path.join(Audio_Tuner.tuned_path, 'en-us.lm.bin'))
+        config.set_string('-hmm', os.path.join(tuned_path, 'en-us-adapt'))
+        config.set_string('-lm', os.path.join(tuned_path, 'en-us.lm.bin'))
         #print("Using custom lm")
         #config.set_string('-lm', "/tmp/knowledge_base.lm")
 
@@ -167,96 +213,335 @@ class Speech_Recognition_Wrapper:
 
         return config
 
-    def run(self):
+    def run(self, audio_source=None):
+        """Runs the decoder over audio_source, defaulting to the mic
+
+        Any Audio_Source works, so File_Audio_Source or Bytes_Audio_Source
+        decode recordings faster than real time"""
+
         if self.quiet:
             func = self.callbacks_dict[input("Quiet mode. Type command ").lower()]
-        stream, _, __ = self.start_audio()
-        self.run_decoder(stream)
+        if audio_source is None:
+            # Captured on its own thread so slow decoding doesn't drop audio
+            audio_source = Buffered_Audio_Source(Microphone_Audio_Source())
+        with audio_source:
+            try:
+                self.run_decoder(audio_source)
+            finally:
+                if isinstance(audio_source, Buffered_Audio_Source):
+                    logging.info(f"Capture buffer: {audio_source.stats}")
+
+    def set_keywords(self, keywords_dict, callbacks_dict=None):
+        """Swaps in new keywords while running, without a new decoder
+
+        Safe to call from any thread, the swap happens at the next chunk
+        (see swap_keywords). callbacks_dict is kept if None. Raises
+        ValueError if a word has no pronunciation"""
+
+        keywords_dict = {k.lower(): v for k, v in keywords_dict.items()}
+        # Looked up here so a bad keyword fails in the caller's thread,
+        # and outside the lock since it reads the whole dict
+        prons = self.pronunciations(keywords_dict)
+        with self._keywords_lock:
+            if callbacks_dict is None:
+                callbacks_dict = self._current_keywords()[1]
+            self._pending_keywords = (keywords_dict,
+                                      dict(callbacks_dict),
+                                      prons)
+
+    def add_keyword(self, phrase, threshold=-10, callback=None):
+        phrase = phrase.lower()
+        prons = self.pronunciations([phrase])
+
+        def update(keywords_dict, callbacks_dict):
+            keywords_dict[phrase] = threshold
+            if callback is not None:
+                callbacks_dict[phrase] = callback
+
+        self._update_keywords(update, prons)
+
+    def remove_keyword(self, phrase):
+        phrase = phrase.lower()
+
+        def update(keywords_dict, callbacks_dict):
+            keywords_dict.pop(phrase, None)
+            callbacks_dict.pop(phrase, None)
+
+        self._update_keywords(update)
+
+    def set_threshold(self, phrase, threshold):
+        phrase = phrase.lower()
+
+        def update(keywords_dict, callbacks_dict):
+            if phrase not in keywords_dict:
+                raise KeyError(phrase)
+            keywords_dict[phrase] = threshold
+
+        self._update_keywords(update)
+
+    def _update_keywords(self, update, prons={}):
+        """Runs update on copies of the current keywords and callbacks,
+        then makes them pending, all under the lock so that concurrent
+        changes aren't lost. prons are those of any new words"""
+
+        with self._keywords_lock:
+            keywords_dict, callbacks_dict = self._current_keywords()
+            update(keywords_dict, callbacks_dict)
+            pending = self._pending_keywords
+            # Words of a pending swap aren't in the decoder yet either
+            pending_prons = pending[2] if pending is not None else {}
+            self._pending_keywords = (keywords_dict,
+                                      callbacks_dict,
+                                      {**pending_prons, **prons})
+
+    def pronunciations(self, phrases):
+        """Dict entries of the words of phrases, see set_keywords"""
+
+        words = {word for phrase in phrases for word in phrase.lower().split()}
+        source_path = os.path.join(self.model_path, 'cmudict-en-us.dict')
+        return language_dict.pronunciations(source_path, words)
+
+    @property
+    def current_keywords(self):
+        """Copies of the keywords and callbacks, pending ones included"""
+
+        with self._keywords_lock:
+            return self._current_keywords()
+
+    def _current_keywords(self):
+        # Callers hold _keywords_lock
+        pending = self._pending_keywords
+        if pending is not None:
+            return dict(pending[0]), dict(pending[1])
+        return dict(self.keywords_dict), dict(self.callbacks_dict)
+
+    def watch_keywords(self, path, interval=1.0):
+        """Reloads keywords whenever the kws list at path is edited"""
+
+        self.keyword_watcher = Keyword_Watcher(path,
+                                               self.set_keywords,
+                                               interval)
+        self.keyword_watcher.start()
+        return self.keyword_watcher
+
+    def swap_keywords(self, decoder, audio_time):
+        """Switches the running decoder to the pending keywords
+
+        Only words missing from the decoder's dict are added, and the
+        new kws list becomes a named search that replaces the active
+        one, so no model is reloaded and no audio is dropped"""
+
+        start = perf_counter()
+        with self._keywords_lock:
+            keywords_dict, callbacks_dict, prons = self._pending_keywords
+            self._pending_keywords = None
+        missing = [(entry, phones) for entry, phones in prons.items()
+                   if decoder.lookup_word(entry) is None]
+        for i, (entry, phones) in enumerate(missing):
+            # Only the last one rebuilds the search structures
+            decoder.add_word(entry, phones, i == len(missing) - 1)
+        self.keywords_dict = keywords_dict
+        self.write_keywords(swap=True)
+        # Searches can only change between utterances
+        decoder.end_utt()
+        self._searches += 1
+        search = f"kws_{self._searches}"
+        decoder.set_kws(search, self.keywords_path)
+        decoder.set_search(search)
+        if self._active_search is not None:
+            decoder.unset_search(self._active_search)
+        self._active_search = search
+        decoder.start_utt()
+        self.callbacks_dict = callbacks_dict
+        self.keyword_matcher = Keyword_Matcher(callbacks_dict)
+        self.endpointer.start(audio_time)
+        seconds = perf_counter() - start
+        self.keyword_swap_latency.observe(seconds)
+        if self.metrics is not None:
+            self.metrics.observe("keyword_swap_seconds", seconds)
+        logging.info(f"Swapped in {len(keywords_dict)} keywords in "
+                     f"{seconds * 1000:.1f} ms, "
+                     f"{len(missing)} new dict entries")
+
+    def restore_search(self, decoder):
+        """Puts the config's own search back before the decoder is pooled
+
+        The keywords stay pending so the next decoder gets them too"""
+
+        if self._active_search is None:
+            return
+        try:
+            decoder.end_utt()
+        except Exception:
+            # Wasn't in an utterance
+            pass
+        decoder.set_search("_default")
+        decoder.unset_search(self._active_search)
+        self._active_search = None
+        if self._pending_keywords is not None:
+            return
+        # Outside the lock since it reads the whole dict
+        prons = self.pronunciations(self.keywords_dict)
+        with self._keywords_lock:
+            if self._pending_keywords is None:
+                self._pending_keywords = (self.keywords_dict,
+                                          self.callbacks_dict,
+                                          prons)
 
     def start_audio(self):
-        # https://github.com/spatialaudio/python-sounddevice/
-        # issues/11#issuecomment-155836787
-        devnull = os.open(os.devnull, os.O_WRONLY)
-        old_stderr = os.dup(2)
-        sys.stderr.flush()
-        os.dup2(devnull, 2)
-        os.close(devnull)
         chunks = 1024
-        p = pyaudio.PyAudio()
-        stream = p.open(format=pyaudio.paInt16,
-                        channels=1,
-                        rate=16000,
-                        input=True,
-                        frames_per_buffer=chunks)
-        stream.start_stream()
-        print("stream started")
+        stream, p = Microphone_Audio_Source.open_stream(chunks)
         return stream, p, chunks
-        os.dup2(old_stderr, 2)
-        os.close(old_stderr)
 
-    def run_decoder(self, stream):
+    def run_decoder(self, audio_source):
+        # Warm decoder from the pool rather than reloading the model
+        with self.decoder_pool.decoder(self.config) as decoder:
+            try:
+                self.decode(decoder, audio_source)
+            finally:
+                self.restore_search(decoder)
+        logging.info(f"Decoder pool: {self.decoder_pool.stats}")
+
+    def decode(self, decoder, audio_source):
         # Process audio chunk by chunk. On keyword detected process/restart
-        decoder = Decoder(self.config)
         #decoder.set_search('keywords')
         decoder.start_utt()
-
-        last_decode_str = None
-        last_decode_time = perf_counter()
+        # callback_time_dict fires from its own thread, never this loop
+        self.scheduler.start()
+
+        # Also accepts a bare PyAudio stream
+        chunk_size = getattr(audio_source, "chunk_size", 1024)
+        sample_width = getattr(audio_source, "sample_width", 2)
+        samples_fed = 0
+        decode_seconds = 0
+        self.endpointer.start(0)
+        last_hypstr = None
+        self.audio_source = audio_source
+        # Local, and every use is behind a None check so it's ~free when off
+        metrics = self.metrics
         # https://stackoverflow.com/a/47371315/8903959
         while True:
-            buf = stream.read(1024)
-            if buf:
-                decoder.process_raw(buf, False, False)
-            else:
+            if metrics is not None:
+                read_start = perf_counter()
+            buf = audio_source.read(chunk_size)
+            if not buf:
                 break
-
-            _time_check = datetime.now().replace(second=0, microsecond=0)
-            if _time_check in self.callback_time_dict:
-                stream.stop_stream()
-                decoder.end_utt()
-                self.callback_time_dict[_time_check]()
-                # Wait until the next minute
-                time.sleep(60)
-                stream.start_stream()
-                print("Listening again\r")
-                decoder.start_utt()
-                just_restarted = True
-                
-            if decoder.hyp() is not None:
-                if last_decode_str == decoder.hyp().hypstr:
-                    reset_max = 5
-                    if perf_counter() - last_decode_time > reset_max:
-                        print(f"No kwrds in the last {reset_max}s, resetting\r")
-                        decoder.end_utt()
-                        decoder.start_utt()
+            if metrics is not None:
+                metrics.observe("read_seconds", perf_counter() - read_start)
+            if self._pending_keywords is not None:
+                self.swap_keywords(decoder,
+                                   samples_fed / Audio_Source.sample_rate)
+                last_hypstr = None
+            if self.vad is None:
+                bufs = [buf]
+            else:
+                # Silence never reaches the decoder
+                was_open = self.vad.is_open
+                bufs = self.vad.process(buf)
+                if not bufs:
                     continue
-                
-                else:
-                    last_decode_str = decoder.hyp().hypstr
-                    last_decode_time = perf_counter()
-                    print(decoder.hyp().hypstr + "\r")
-
-                just_restarted = False
-                split_words = decoder.hyp().hypstr.lower().split()
-                for i in range(len(split_words)):
-                    together = " ".join(split_words[i:])
-                    if together in self.callbacks_dict:
-                        stream.stop_stream()
-                        decoder.end_utt()
+            start = process_time()
+            if metrics is not None:
+                process_start = perf_counter()
+            for buf in bufs:
+                decoder.process_raw(buf, False, False)
+                samples_fed += len(buf) // sample_width
+            decode_seconds += process_time() - start
+            if metrics is not None:
+                match_start = perf_counter()
+                metrics.observe("process_raw_seconds",
+                                match_start - process_start)
+            # Decoder time, skipped silence isn't counted
+            audio_time = samples_fed / Audio_Source.sample_rate
+
+            # hyp() builds a new object each call, so only once per chunk
+            hyp = decoder.hyp()
+            if hyp is not None and hyp.hypstr != last_hypstr:
+                last_hypstr = hyp.hypstr
+                print(hyp.hypstr + "\r")
+                # Only looks at words added since the last hypothesis
+                matches = self.keyword_matcher.update(hyp.hypstr)
+                if metrics is not None:
+                    metrics.observe("match_seconds",
+                                    perf_counter() - match_start)
+                if matches:
+                    self.record_detection_latency(decoder, audio_time)
+                    for together in dict.fromkeys(matches):
+                        if metrics is not None:
+                            metrics.inc("detections_total", keyword=together)
                         callback = self.callbacks_dict[together]
-                        #print([(seg.word, seg.prob) for seg in decoder.seg()])
                         print(f"\n{callback.__name__}")
-                        try:
-                            callback(decoder.hyp().hypstr)
-                        except Exception as e:
-                            print(e)
-                        stream.start_stream()
-                        print("Listening again\r")
-                        decoder.start_utt()
-                        just_restarted = True
-                        break
-                
-                if not just_restarted and len(decoder.hyp().hypstr) > 25:
-                    print("No keyword, restarting search\r")
-                    decoder.end_utt()
-                    decoder.start_utt()
+                        # Runs on the dispatcher's threads, so keep listening
+                        self.callback_dispatcher.submit(together,
+                                                        callback,
+                                                        hyp.hypstr)
+                    self.restart_utt(decoder, audio_time, "keyword")
+                    last_hypstr = None
+                    continue
+            elif metrics is not None:
+                metrics.observe("match_seconds", perf_counter() - match_start)
+
+            if self.vad is not None and was_open and not self.vad.is_open:
+                reason = "vad_closed"
+            else:
+                reason = self.endpointer.update(audio_time,
+                                                decoder.get_in_speech())
+            if reason is not None:
+                logging.debug(f"Restarting utterance: {reason}")
+                self.restart_utt(decoder, audio_time, reason)
+                last_hypstr = None
+
+        decoder.end_utt()
+        self.scheduler.stop()
+        self.callback_dispatcher.join()
+        logging.info(f"Callbacks: {self.callback_dispatcher.stats}")
+        logging.info(f"Utterance restarts: {self.endpointer.restarts}")
+        logging.info(f"Detection latency: {self.detection_latency.as_dict()}")
+        if self.keyword_swap_latency.count:
+            logging.info("Keyword swap latency: "
+                         f"{self.keyword_swap_latency.as_dict()}")
+        if self.vad is not None:
+            logging.info(f"VAD: {self.vad.stats(decode_seconds)}")
+
+    def restart_utt(self, decoder, audio_time, reason):
+        decoder.end_utt()
+        decoder.start_utt()
+        self.keyword_matcher.reset()
+        self.endpointer.start(audio_time)
+        if self.metrics is not None:
+            self.metrics.inc("utterance_restarts_total", reason=reason)
+
+    def record_detection_latency(self, decoder, audio_time):
+        """Audio seconds between the end of the keyword and its detection"""
+
+        end_frame = max((seg.end_frame for seg in decoder.seg()), default=None)
+        if end_frame is not None:
+            # pocketsphinx default -frate is 100 frames/s
+            end_time = self.endpointer.utt_start_time + end_frame / 100
+            latency = max(audio_time - end_time, 0)
+            self.detection_latency.observe(latency)
+            if self.metrics is not None:
+                self.metrics.observe("detection_latency_seconds", latency)
+
+    def add_metrics_collectors(self):
+        """Exports component stats as gauges when metrics are scraped"""
+
+        def numeric(prefix, stats):
+            return {prefix + k: v for k, v in stats.items()
+                    if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+        def capture_stats():
+            stats = getattr(self.audio_source, "stats", None)
+            return numeric("capture_", stats) if isinstance(stats, dict) else {}
+
+        self.metrics.add_collector(capture_stats)
+        self.metrics.add_collector(
+            lambda: numeric("decoder_pool_", self.decoder_pool.stats))
+        self.metrics.add_collector(
+            lambda: numeric("callbacks_", self.callback_dispatcher.stats))
+        self.metrics.add_collector(
+            lambda: numeric("scheduler_", {"fired": self.scheduler.fired,
+                                           "missed": self.scheduler.missed}))
+        if self.vad is not None:
+            self.metrics.add_collector(lambda: numeric("vad_",
+                                                       self.vad.stats()))
@@ -0,0 +1,49 @@
+import os
+
+from ..artifact_cache import Artifact_Cache
+
+
+class Builds:
+    """Counts builds of a tree with a .git dir and one declared output"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, path):
+        self.count += 1
+        os.makedirs(os.path.join(path, ".git"))
+        os.makedirs(os.path.join(path, "bin"))
+        for rel_path in ["bin/tool", ".git/HEAD", "Makefile"]:
+            with open(os.path.join(path, rel_path), "w") as f:
+                f.write(rel_path)
+
+
+def test_added_files_keep_cache(tmp_path):
+    cache = Artifact_Cache(str(tmp_path))
+    build = Builds()
+    path = cache.get("tool", "url", "commit", build=build)
+    # Like the files make install or a libtool wrapper leave behind
+    with open(os.path.join(path, "bin", "lt-tool"), "w") as f:
+        f.write("wrapper")
+    with open(os.path.join(path, ".git", "HEAD"), "w") as f:
+        f.write("moved")
+    assert cache.get("tool", "url", "commit", build=build) == path
+    assert build.count == 1
+
+
+def test_only_declared_outputs_are_checked(tmp_path):
+    cache = Artifact_Cache(str(tmp_path))
+    build = Builds()
+    path = cache.get("tool", "url", "commit",
+                     build=build,
+                     outputs=["bin/tool"])
+    with open(os.path.join(path, "Makefile"), "w") as f:
+        f.write("changed")
+    cache.get("tool", "url", "commit", build=build, outputs=["bin/tool"])
+    assert build.count == 1
+    with open(os.path.join(path, "bin", "tool"), "w") as f:
+        f.write("changed")
+    cache.get("tool", "url", "commit", build=build, outputs=["bin/tool"])
+    assert build.count == 2
+    with open(os.path.join(path, "bin", "tool"), "r") as f:
+        assert f.read() == "bin/tool"
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+pytest.importorskip("pathos")
+pytest.importorskip("lib_utils")
+pytest.importorskip("pocketsphinx")
+
+from ..audio_tuner import Audio_Tuner
+
+
+class Stub_Tuner(Audio_Tuner):
+    """Stages that write their outputs instead of recording and training
+
+    run_adapt fails while fail_adapt is set"""
+
+    fail_adapt = False
+    ran = []
+
+    def install_sudo_deps(self):
+        pass
+
+    def _run(self, name, *paths):
+        self.ran.append(name)
+        for path in paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(name)
+
+    def make_file_dirs(self):
+        os.makedirs(self.tuned_path, exist_ok=True)
+        os.makedirs(self.audio_path, exist_ok=True)
+        self.ran.append("make_file_dirs")
+
+    def record_files(self):
+        self._run("record_files",
+                  self.audio_file_ids_path,
+                  self.audio_transcription_path)
+
+    def augment_files(self):
+        os.makedirs(self.augmented_path, exist_ok=True)
+        self.ran.append("augment_files")
+
+    def copy_files(self):
+        self._run("copy_files", self.file_ids_path, self.transcription_path)
+
+    def install_sphinx_base(self):
+        self._run("install_sphinx_base",
+                  self.tuned("sphinxbase"),
+                  self.tuned("sphinx_fe"))
+
+    def download_proper_en(self):
+        self._run("download_proper_en",
+                  self.tuned("en-us", "means"),
+                  self.tuned("en-us", "mdef"),
+                  self.tuned("en-us", "feat.params"),
+                  self.tuned("cmudict-en-us.dict"))
+
+    def convert_mdef(self):
+        self._run("convert_mdef",
+                  self.tuned("pocketsphinx"),
+                  self.tuned("en-us", "mdef.txt"))
+
+    def download_sphinxtrain(self):
+        self._run("download_sphinxtrain",
+                  self.tuned("sphinxtrain"),
+                  self.tuned("bw"),
+                  self.tuned("map_adapt"))
+
+    def run_sphinx_fe(self):
+        self._run("run_sphinx_fe",
+                  self.tuned(self.mfcc_cache_dir_name, "x.mfc"))
+
+    def run_bw(self):
+        self._run("run_bw", self.manifest_path)
+
+    def run_adapt(self):
+        if self.fail_adapt:
+            raise RuntimeError("run_adapt failed")
+        self._run("run_adapt", self.tuned("en-us-adapt", "means"))
+
+    def tuned(self, *parts):
+        return os.path.join(self.tuned_path, *parts)
+
+
+@pytest.fixture
+def tuner(tmp_path, monkeypatch):
+    monkeypatch.setattr(Stub_Tuner, "tuned_path", str(tmp_path / "tuned"))
+    monkeypatch.setattr(Stub_Tuner, "audio_path", str(tmp_path / "audio"))
+    monkeypatch.setattr(Stub_Tuner, "ran", [])
+    # Already pinned, so nothing is resolved over the network
+    monkeypatch.setattr(Stub_Tuner,
+                        "sphinx_repos",
+                        {name: (url, "0" * 40) for name, (url, _)
+                         in Audio_Tuner.sphinx_repos.items()})
+    monkeypatch.setattr("builtins.input", lambda *args: "user")
+
+    def make(**kwargs):
+        return Stub_Tuner(["go to school"], augmenter=False, **kwargs)
+    return make
+
+
+def test_resumes_session_after_failure(tuner, monkeypatch):
+    first = tuner()
+    monkeypatch.setattr(Stub_Tuner, "fail_adapt", True)
+    with pytest.raises(RuntimeError):
+        first.generate_new_model()
+    assert "record_files" in Stub_Tuner.ran
+
+    monkeypatch.setattr(Stub_Tuner, "fail_adapt", False)
+    monkeypatch.setattr(Stub_Tuner, "ran", [])
+    second = tuner()
+    assert second.session_id == first.session_id
+    second.generate_new_model()
+    assert "record_files" not in Stub_Tuner.ran
+    assert Stub_Tuner.ran == ["run_adapt"]
+
+
+def test_new_session_after_finishing(tuner, monkeypatch):
+    first = tuner()
+    first.generate_new_model()
+    assert not os.path.exists(first.session_path)
+    monkeypatch.setattr(Stub_Tuner,
+                        "new_session_id",
+                        lambda self: "2020_01_01_00_00_00_user_")
+    monkeypatch.setattr(Stub_Tuner, "ran", [])
+    second = tuner()
+    assert second.session_id != first.session_id
+    second.generate_new_model()
+    assert "record_files" in Stub_Tuner.ran
+
+
+def test_rerun_record_files_starts_new_session(tuner, monkeypatch):
+    first = tuner()
+    monkeypatch.setattr(Stub_Tuner, "fail_adapt", True)
+    with pytest.raises(RuntimeError):
+        first.generate_new_model()
+    monkeypatch.setattr(Stub_Tuner, "fail_adapt", False)
+    second = tuner()
+    monkeypatch.setattr(Stub_Tuner,
+                        "new_session_id",
+                        lambda self: "2020_01_01_00_00_00_user_")
+    second.generate_new_model(rerun=["record_files"])
+    assert second.session_id == "2020_01_01_00_00_00_user_"
+    assert not os.path.exists(second.session_path)
@@ -0,0 +1,49 @@
+import threading
+
+from ..callback_dispatcher import Callback_Dispatcher
+
+
+def test_callback_runs_after_timeout():
+    hung = threading.Event()
+    ran = threading.Event()
+    dispatcher = Callback_Dispatcher(concurrency=1, timeout=0.05)
+    try:
+        assert dispatcher.submit("hang", hung.wait)
+        assert dispatcher.join(timeout=5)
+        assert dispatcher.stats["timed_out"] == 1
+        # The only worker is still stuck in hung.wait
+        assert dispatcher.submit("next", ran.set)
+        assert ran.wait(timeout=5)
+        assert dispatcher.join(timeout=5)
+    finally:
+        hung.set()
+        dispatcher.shutdown()
+
+
+def test_abandoned_past_cap_keep_their_slots():
+    hung = threading.Event()
+    dispatcher = Callback_Dispatcher(concurrency=1,
+                                     max_pending=0,
+                                     timeout=0.05,
+                                     max_abandoned=0)
+    try:
+        assert dispatcher.submit("hang", hung.wait)
+        assert not dispatcher.join(timeout=0.2)
+        assert dispatcher.stats["timed_out"] == 1
+        assert not dispatcher.submit("next", lambda: None)
+    finally:
+        hung.set()
+        dispatcher.shutdown()
+    assert dispatcher.join(timeout=5)
+
+
+def test_coalesces_pending_key():
+    release = threading.Event()
+    dispatcher = Callback_Dispatcher(concurrency=1)
+    try:
+        assert dispatcher.submit("a", release.wait)
+        assert not dispatcher.submit("a", release.wait)
+        assert dispatcher.stats["coalesced"] == 1
+    finally:
+        release.set()
+        dispatcher.shutdown()
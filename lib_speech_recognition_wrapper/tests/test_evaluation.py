@@ -0,0 +1,52 @@
+import pytest
+
+from ..evaluation import (Model_Evaluator,
+                          count_phrase,
+                          read_kws_keywords,
+                          read_transcriptions,
+                          word_errors)
+
+
+@pytest.mark.parametrize("reference, hypothesis, errors", [
+    ("go to school", "go to school", (0, 0, 0)),
+    ("go to school", "go to pool", (1, 0, 0)),
+    ("go to school", "go school", (0, 1, 0)),
+    ("go to school", "go to the school", (0, 0, 1)),
+    ("go to school", "", (0, 3, 0)),
+    ("", "go", (0, 0, 1)),
+    ("open new tab", "new tab please", (0, 1, 1))])
+def test_word_errors(reference, hypothesis, errors):
+    assert word_errors(reference.split(), hypothesis.split()) == errors
+
+
+def test_count_phrase():
+    words = "go go go to go to".split()
+    assert count_phrase(words, "go to") == 2
+    # Not overlapping
+    assert count_phrase("go go go".split(), "go go") == 1
+    assert count_phrase([], "go") == 0
+
+
+def test_read_transcriptions(tmp_path):
+    path = tmp_path / "assistant.transcription"
+    path.write_text("<s> Go To School </s> (user_0001_go_to_school)\n"
+                    "not a transcription line\n"
+                    "<s> new tab </s> (user_0002_new_tab)\n")
+    assert read_transcriptions(path) == {
+        "user_0001_go_to_school": ["go", "to", "school"],
+        "user_0002_new_tab": ["new", "tab"]}
+
+
+def test_read_kws_keywords(tmp_path):
+    path = tmp_path / "kws.list"
+    path.write_text("GO TO SCHOOL /1e-10/\n\nNEW TAB /1e-5/\n")
+    assert read_kws_keywords(path) == ["go to school", "new tab"]
+
+
+def test_precision_recall():
+    assert Model_Evaluator._precision_recall(3, 4, 6) == {
+        "precision": 0.75,
+        "recall": 0.5,
+        "false_alarms": 1,
+        "misses": 3}
+    assert Model_Evaluator._precision_recall(0, 0, 0)["precision"] is None
@@ -0,0 +1,42 @@
+from ..keyword_matcher import Keyword_Matcher
+
+
+def test_new_tokens_only():
+    matcher = Keyword_Matcher(["go to school"])
+    assert matcher.update("go to") == []
+    assert matcher.update("go to school") == ["go to school"]
+    # Already reported, nothing new
+    assert matcher.update("go to school") == []
+
+
+def test_overlapping_keywords():
+    matcher = Keyword_Matcher(["new tab", "open new tab", "tab"])
+    assert sorted(matcher.update("open new tab")) == ["new tab",
+                                                      "open new tab",
+                                                      "tab"]
+
+
+def test_partial_word_growth_is_a_revision():
+    matcher = Keyword_Matcher(["tab"])
+    # "ta" grew into "tab", which isn't a new token after a space
+    assert matcher.update("open ta") == []
+    assert matcher.update("open tab") == ["tab"]
+
+
+def test_revision_only_reports_after_the_change():
+    matcher = Keyword_Matcher(["scroll up", "go"])
+    assert matcher.update("go scroll down") == ["go"]
+    # "go" is unchanged so it isn't reported again
+    assert matcher.update("go scroll up") == ["scroll up"]
+
+
+def test_reset_starts_a_new_utterance():
+    matcher = Keyword_Matcher(["go"])
+    assert matcher.update("go") == ["go"]
+    matcher.reset()
+    assert matcher.update("go") == ["go"]
+
+
+def test_case_insensitive():
+    matcher = Keyword_Matcher(["Go To School"])
+    assert matcher.update("GO TO SCHOOL") == ["Go To School"]
@@ -0,0 +1,40 @@
+import pytest
+
+from ..keyword_spotter import spot_keywords
+
+
+class Fake_Decoder:
+    """Only tracks whether an utterance is open, like a kws decoder
+    that never detects anything"""
+
+    def __init__(self):
+        self.in_utt = False
+
+    def start_utt(self):
+        assert not self.in_utt
+        self.in_utt = True
+
+    def end_utt(self):
+        assert self.in_utt
+        self.in_utt = False
+
+    def process_raw(self, buf, no_search, full_utt):
+        pass
+
+    def hyp(self):
+        return None
+
+
+def failing_source():
+    yield b"\0" * 1024
+    raise OSError("truncated")
+
+
+def test_failed_stream_ends_utterance():
+    decoder = Fake_Decoder()
+    with pytest.raises(OSError):
+        spot_keywords(decoder, failing_source())
+    assert not decoder.in_utt
+    # The next stream can start its utterance
+    assert spot_keywords(decoder, [b"\0" * 1024]) == []
+    assert not decoder.in_utt
@@ -0,0 +1,41 @@
+import pytest
+
+from .. import language_dict
+
+
+def test_parse_keywords_list():
+    text = ("GO TO SCHOOL /1e-10/\n"
+            "\n"
+            "  new tab   /1e-5/  \n"
+            "scroll up /1e-2.5/\n")
+    assert language_dict.parse_keywords_list(text) == {"go to school": -10,
+                                                       "new tab": -5,
+                                                       "scroll up": -2.5}
+
+
+@pytest.mark.parametrize("line", ["GO TO SCHOOL", "GO /1e/", "/1e-10/",
+                                  "GO /1e-10"])
+def test_parse_keywords_list_bad_lines(line):
+    with pytest.raises(ValueError):
+        language_dict.parse_keywords_list(line)
+
+
+def test_keywords_list_round_trip():
+    keywords_dict = {"go to school": -10, "new tab": 5}
+    text = language_dict.keywords_list(keywords_dict)
+    assert text == "GO TO SCHOOL /1e-10/\nNEW TAB /1e5/\n"
+    assert language_dict.parse_keywords_list(text) == keywords_dict
+
+
+def test_pronunciations(tmp_path):
+    path = tmp_path / "en.dict"
+    path.write_text("go G OW\n"
+                    "tab T AE B\n"
+                    "to T UW\n"
+                    "to(2) T IH\n")
+    assert language_dict.pronunciations(path, ["to", "go"]) == {
+        "go": "G OW",
+        "to": "T UW",
+        "to(2)": "T IH"}
+    with pytest.raises(ValueError):
+        language_dict.pronunciations(path, ["school"])
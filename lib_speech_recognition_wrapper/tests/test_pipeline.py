@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from ..pipeline import Pipeline, Stage
+
+
+class Stages:
+    """Three chained stages that log their runs and write their outputs"""
+
+    def __init__(self, tmp_path, fail=()):
+        self.tmp_path = tmp_path
+        self.fail = set(fail)
+        self.ran = []
+
+    def _run(self, name):
+        if name in self.fail:
+            raise RuntimeError(f"{name} failed")
+        self.ran.append(name)
+        with open(os.path.join(self.tmp_path, name), "w") as f:
+            f.write(name)
+
+    def first(self):
+        self._run("first")
+
+    def second(self):
+        self._run("second")
+
+    def third(self):
+        self._run("third")
+
+    def pipeline(self, params=()):
+        out = lambda x: os.path.join(self.tmp_path, x)
+        stages = [Stage(self.first,
+                        params=list(params),
+                        outputs=[out("first")]),
+                  Stage(self.second,
+                        deps=["first"],
+                        inputs=[out("first")],
+                        outputs=[out("second")]),
+                  Stage(self.third,
+                        deps=["second"],
+                        inputs=[out("second")],
+                        outputs=[out("third")])]
+        return Pipeline(stages, out(".stages"))
+
+
+def test_runs_in_order_then_skips(tmp_path):
+    stages = Stages(tmp_path)
+    stages.pipeline().run()
+    assert stages.ran == ["first", "second", "third"]
+    stages.ran = []
+    stages.pipeline().run()
+    assert stages.ran == []
+
+
+def test_resumes_after_failure(tmp_path):
+    stages = Stages(tmp_path, fail=["third"])
+    with pytest.raises(RuntimeError):
+        stages.pipeline().run()
+    assert stages.ran == ["first", "second"]
+    stages.fail = set()
+    stages.ran = []
+    stages.pipeline().run()
+    assert stages.ran == ["third"]
+
+
+def test_rerun_runs_dependents(tmp_path):
+    stages = Stages(tmp_path)
+    stages.pipeline().run()
+    stages.ran = []
+    stages.pipeline().run(rerun=["second"])
+    assert stages.ran == ["second", "third"]
+
+
+def test_changed_params_rerun(tmp_path):
+    stages = Stages(tmp_path)
+    stages.pipeline(params=[1]).run()
+    stages.ran = []
+    stages.pipeline(params=[2]).run()
+    assert stages.ran == ["first", "second", "third"]
+
+
+def test_missing_output_reruns(tmp_path):
+    stages = Stages(tmp_path)
+    stages.pipeline().run()
+    stages.ran = []
+    os.remove(os.path.join(tmp_path, "third"))
+    stages.pipeline().run()
+    assert stages.ran == ["third"]
+
+
+def test_changed_input_reruns(tmp_path):
+    stages = Stages(tmp_path)
+    stages.pipeline().run()
+    stages.ran = []
+    with open(os.path.join(tmp_path, "second"), "a") as f:
+        f.write("edited")
+    stages.pipeline().run()
+    assert stages.ran == ["third"]
+
+
+def test_unknown_dep(tmp_path):
+    stages = Stages(tmp_path)
+    with pytest.raises(AssertionError):
+        Pipeline([Stage(stages.first, deps=["missing"])], str(tmp_path))
+
+
+def test_cycle(tmp_path):
+    stages = Stages(tmp_path)
+    pipeline = Pipeline([Stage(stages.first, deps=["second"]),
+                         Stage(stages.second, deps=["first"])],
+                        str(tmp_path))
+    with pytest.raises(ValueError):
+        pipeline.run()
+    assert stages.ran == []
@@ -0,0 +1,90 @@
+import threading
+
+from ..audio_sources import Bytes_Audio_Source
+from ..ring_buffer import Buffered_Audio_Source, Ring_Buffer
+
+
+def test_fifo():
+    ring_buffer = Ring_Buffer(8)
+    ring_buffer.write(b"abc")
+    ring_buffer.write(b"de")
+    assert ring_buffer.depth == 5
+    assert ring_buffer.read(4) == b"abcd"
+    assert ring_buffer.read(1) == b"e"
+    assert ring_buffer.depth == 0
+
+
+def test_wraparound():
+    ring_buffer = Ring_Buffer(8)
+    ring_buffer.write(b"abcdef")
+    assert ring_buffer.read(5) == b"abcde"
+    # Written across the end of the storage
+    ring_buffer.write(b"ghijk")
+    assert ring_buffer.read(6) == b"fghijk"
+    assert ring_buffer.overflows == 0
+
+
+def test_overflow_drops_oldest():
+    ring_buffer = Ring_Buffer(8)
+    ring_buffer.write(b"abcdef")
+    ring_buffer.write(b"ghij")
+    assert ring_buffer.overflows == 1
+    assert ring_buffer.overflowed_bytes == 2
+    assert ring_buffer.read(8) == b"cdefghij"
+
+
+def test_write_larger_than_buffer():
+    ring_buffer = Ring_Buffer(4)
+    ring_buffer.write(b"ab")
+    ring_buffer.write(b"cdefgh")
+    assert ring_buffer.read(4) == b"efgh"
+    assert ring_buffer.overflows == 1
+    assert ring_buffer.overflowed_bytes == 4
+    assert ring_buffer.stats["max_depth"] == 4
+
+
+def test_read_timeout_returns_what_there_is():
+    ring_buffer = Ring_Buffer(8)
+    ring_buffer.write(b"ab")
+    assert ring_buffer.read(4, timeout=0.01) == b"ab"
+
+
+def test_closed_and_drained():
+    ring_buffer = Ring_Buffer(8)
+    ring_buffer.write(b"ab")
+    ring_buffer.close()
+    assert ring_buffer.read(4) == b"ab"
+    assert ring_buffer.read(4) == b""
+
+
+def test_reader_and_writer_threads():
+    ring_buffer = Ring_Buffer(64)
+    data = bytes(range(256)) * 40
+    # One chunk in flight, so it wraps around without overflowing
+    room = threading.Semaphore(1)
+
+    def write():
+        for i in range(0, len(data), 48):
+            room.acquire()
+            ring_buffer.write(data[i:i + 48])
+        ring_buffer.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    received = []
+    while True:
+        buf = ring_buffer.read(48)
+        if not buf:
+            break
+        received.append(buf)
+        room.release()
+    writer.join()
+    assert b"".join(received) == data
+    assert ring_buffer.overflows == 0
+
+
+def test_buffered_audio_source():
+    data = bytes(range(256)) * 64
+    source = Buffered_Audio_Source(Bytes_Audio_Source(data, chunk_size=100))
+    with source:
+        assert b"".join(source) == data
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from ..scheduler import Cron_Schedule, Interval_Schedule, One_Shot_Schedule
+
+
+def test_cron_every_minute():
+    schedule = Cron_Schedule("* * * * *")
+    after = datetime(2024, 1, 1, 12, 30, 15)
+    assert schedule.next_fire(after) == datetime(2024, 1, 1, 12, 31)
+
+
+def test_cron_daily():
+    schedule = Cron_Schedule("30 8 * * *")
+    assert (schedule.next_fire(datetime(2024, 1, 1, 9, 0))
+            == datetime(2024, 1, 2, 8, 30))
+
+
+def test_cron_day_or_weekday():
+    # Both restricted, so the 13th or any Friday
+    schedule = Cron_Schedule("0 12 13 * 5")
+    # 2024-09-09 is a Monday, the Friday comes before the 13th
+    assert (schedule.next_fire(datetime(2024, 9, 9))
+            == datetime(2024, 9, 13, 12))
+    assert (schedule.next_fire(datetime(2024, 9, 13, 12))
+            == datetime(2024, 9, 20, 12))
+    # 2024-12-13 is a Friday, 2025-01-13 is a Monday
+    assert (schedule.next_fire(datetime(2025, 1, 11))
+            == datetime(2025, 1, 13, 12))
+
+
+def test_cron_day_and_any_weekday():
+    # Only the day is restricted
+    schedule = Cron_Schedule("0 0 13 * *")
+    assert (schedule.next_fire(datetime(2024, 9, 14))
+            == datetime(2024, 10, 13))
+
+
+def test_cron_feb_29():
+    schedule = Cron_Schedule("0 0 29 2 *")
+    assert (schedule.next_fire(datetime(2025, 3, 1))
+            == datetime(2028, 2, 29))
+
+
+def test_cron_sunday_is_0_and_7():
+    after = datetime(2024, 9, 9)
+    # 2024-09-15 is a Sunday
+    for weekday in ["0", "7"]:
+        schedule = Cron_Schedule(f"0 0 * * {weekday}")
+        assert schedule.next_fire(after) == datetime(2024, 9, 15)
+
+
+def test_cron_ranges_lists_and_steps():
+    schedule = Cron_Schedule("*/15 9-10 * * 1,3")
+    # 2024-09-10 is a Tuesday, so Wednesday 9:00
+    assert (schedule.next_fire(datetime(2024, 9, 10, 10, 50))
+            == datetime(2024, 9, 11, 9))
+    assert (schedule.next_fire(datetime(2024, 9, 11, 9, 1))
+            == datetime(2024, 9, 11, 9, 15))
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *",
+                                        "* 24 * * *", "* * 0 * *"])
+def test_cron_bad_expressions(expression):
+    with pytest.raises(ValueError):
+        Cron_Schedule(expression)
+
+
+def test_interval():
+    start = datetime(2024, 1, 1)
+    schedule = Interval_Schedule(60, start=start)
+    assert schedule.next_fire(start - timedelta(days=1)) == start
+    assert schedule.next_fire(start) == start + timedelta(minutes=1)
+    assert (schedule.next_fire(start + timedelta(seconds=90))
+            == start + timedelta(minutes=2))
+
+
+def test_interval_must_be_positive():
+    with pytest.raises(ValueError):
+        Interval_Schedule(0)
+
+
+def test_one_shot():
+    when = datetime(2024, 1, 1)
+    schedule = One_Shot_Schedule(when)
+    assert schedule.next_fire(when - timedelta(seconds=1)) == when
+    assert schedule.next_fire(when) is None
@@ -0,0 +1,53 @@
+import pytest
+
+from ..threshold_tuner import Threshold_Tuner
+
+
+class Fake_Config:
+    def __init__(self, values):
+        self.values = values
+
+    def get_string(self, key):
+        return self.values[key]
+
+
+@pytest.fixture
+def make_tuner(tmp_path):
+    """Tuners over a compact dict of just their keywords' words"""
+
+    hmm = tmp_path / "en-us"
+    hmm.mkdir()
+    (hmm / "means").write_bytes(b"means")
+    prons = {"go": "G OW",
+             "to": "T UW",
+             "school": "S K UW L",
+             "open": "OW P AH N",
+             "tab": "T AE B"}
+
+    def make(keywords, **changed):
+        words = {word for keyword in keywords for word in keyword.split()}
+        phones = {**prons, **changed}
+        dict_path = tmp_path / f"compact.{len(words)}.dict"
+        dict_path.write_text("".join(f"{word} {phones[word]}\n"
+                                     for word in sorted(words)))
+        tuner = Threshold_Tuner.__new__(Threshold_Tuner)
+        tuner.keywords_dict = {keyword: -20 for keyword in keywords}
+        tuner.config = Fake_Config({"-hmm": str(hmm),
+                                    "-dict": str(dict_path)})
+        return tuner
+    return make
+
+
+def test_adding_keyword_keeps_other_fingerprints(make_tuner):
+    before = make_tuner(["go to school"]).keyword_fingerprints()
+    after = make_tuner(["go to school", "open tab"]).keyword_fingerprints()
+    assert after["go to school"] == before["go to school"]
+    assert after["open tab"] != after["go to school"]
+
+
+def test_pronunciation_change_changes_fingerprint(make_tuner):
+    before = make_tuner(["go to school", "open tab"]).keyword_fingerprints()
+    after = make_tuner(["go to school", "open tab"],
+                       school="S K UH L").keyword_fingerprints()
+    assert after["go to school"] != before["go to school"]
+    assert after["open tab"] == before["open tab"]
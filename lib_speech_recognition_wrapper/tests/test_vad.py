@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from ..vad import Energy_VAD
+
+
+def noise(num_samples, level, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = rng.standard_normal(num_samples) * level
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+@pytest.mark.parametrize("chunk_size", [1024, 4096])
+def test_pre_roll_covers_same_audio_at_any_chunk_size(chunk_size):
+    vad = Energy_VAD(pre_roll_seconds=0.3)
+    for i in range(20):
+        vad.process(noise(chunk_size, 10, seed=i))
+    bufs = vad.process(noise(chunk_size, 10000))
+    assert vad.is_open
+    pre_roll_samples = sum(len(x) for x in bufs[:-1]) // 2
+    # As few whole chunks as hold 0.3 s
+    assert 0.3 * 16000 <= pre_roll_samples < 0.3 * 16000 + chunk_size
+
+
+@pytest.mark.parametrize("chunk_size", [1024, 4096])
+def test_noise_floor_forgets_after_floor_seconds(chunk_size):
+    vad = Energy_VAD(floor_seconds=1)
+    vad.is_speech(noise(chunk_size, 10))
+    quiet_floor = vad.noise_floor_db
+    for i in range(16000 * 2 // chunk_size):
+        vad.is_speech(noise(chunk_size, 300, seed=i))
+    assert vad.noise_floor_db > quiet_floor + 20
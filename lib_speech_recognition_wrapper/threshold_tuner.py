@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import os
+from multiprocessing import Pool, cpu_count
+from time import perf_counter
+
+from . import language_dict
+from .audio_sources import File_Audio_Source
+from .defaults import default_keywords_dict
+from .evaluation import count_phrase, read_transcriptions
+from .keyword_spotter import spot_keywords
+
+# One decoder per worker process, built once by _init_worker
+_decoder = None
+# kws list path -> name of the search made from it on _decoder
+_searches = dict()
+
+
+def _init_worker(wrapper_kwargs):
+    global _decoder
+    # Only workers decode, so picking and keying don't need pocketsphinx
+    from pocketsphinx import Decoder
+
+    from .speech_recognition_wrapper import Speech_Recognition_Wrapper
+
+    # Finds the kws list and dict the parent cached
+    wrapper = Speech_Recognition_Wrapper(**wrapper_kwargs)
+    _decoder = Decoder(wrapper.config)
+
+
+def _decode(task):
+    key, keyword, kws_path, wav_path = task
+    # Swapping searches is far cheaper than a decoder per threshold
+    if kws_path not in _searches:
+        _searches[kws_path] = f"kws_{len(_searches)}"
+        _decoder.set_kws(_searches[kws_path], kws_path)
+    _decoder.set_search(_searches[kws_path])
+    try:
+        with File_Audio_Source(wav_path) as audio_source:
+            duration = audio_source.duration
+            detections = spot_keywords(_decoder, audio_source)
+    except Exception as e:
+        return key, {"error": f"{type(e).__name__}: {e}"}
+    return key, {"detections": sum(x["keyword"] == keyword
+                                   for x in detections),
+                 "audio_seconds": duration}
+
+
+class Threshold_Tuner:
+    """Picks a kws threshold per keyword from labeled recordings
+
+    Every keyword is decoded alone at each of thresholds (the exponent
+    in /1e-10/) over the recordings in audio_path, whose transcriptions
+    say how often each keyword was really said. Recordings of other
+    phrases are the negatives. For each keyword the threshold with the
+    best recall that stays under max_false_alarms_per_hour is picked.
+    Each decode is cached by the wav's content, the acoustic model, the
+    keyword and its pronunciations and the threshold, so repeated sweeps
+    only decode what changed, whatever the other keywords are"""
+
+    def __init__(self,
+                 keywords_dict=None,
+                 removed_words=[],
+                 audio_path="/etc/audio",
+                 thresholds=tuple(range(-50, 5, 5)),
+                 max_false_alarms_per_hour=1.0,
+                 workers=None,
+                 dict_mode="full",
+                 cache_dir=None):
+        self.keywords_dict = keywords_dict or default_keywords_dict
+        self.audio_path = audio_path
+        self.thresholds = list(thresholds)
+        self.max_false_alarms_per_hour = max_false_alarms_per_hour
+        self.workers = workers or cpu_count()
+        self.wrapper_kwargs = {"keywords_dict": self.keywords_dict,
+                               "removed_words": removed_words,
+                               "dict_mode": dict_mode}
+        self.cache_dir = cache_dir or os.path.join(language_dict.cache_dir,
+                                                   "threshold_sweep")
+        from .speech_recognition_wrapper import Speech_Recognition_Wrapper
+
+        # Caches the base kws list and dict before the workers look them up
+        self.config = Speech_Recognition_Wrapper(**self.wrapper_kwargs).config
+        self.cache_hits = 0
+        self.decodes = 0
+
+    def run(self, output_path=None):
+        """Sweeps, picks thresholds, returns (keywords_dict, report)
+
+        The keywords dict is also written to output_path as a kws list,
+        which --watch_keywords and Keyword_Watcher read"""
+
+        start = perf_counter()
+        results = self.sweep()
+        keywords_dict, report = self.pick(results)
+        logging.info(f"Threshold sweep took {perf_counter() - start:.1f}s, "
+                     f"{self.decodes} decodes, {self.cache_hits} cached")
+        for keyword, choice in report.items():
+            logging.info(f"{keyword:<25} 1e{choice['threshold']:<5} "
+                         f"recall {choice['recall']} "
+                         f"false alarms/h {choice['false_alarms_per_hour']:.2f}")
+        if output_path is not None:
+            kws_list = language_dict.keywords_list(keywords_dict)
+            language_dict.atomic_write(output_path, kws_list)
+        return keywords_dict, report
+
+    def sweep(self):
+        """Returns {keyword: {threshold: score dict}}"""
+
+        transcriptions = read_transcriptions(
+            os.path.join(self.audio_path, "assistant.transcription"))
+        wav_paths = {x: os.path.join(self.audio_path, x + ".wav")
+                     for x in transcriptions}
+        wav_paths = {x: path for x, path in wav_paths.items()
+                     if os.path.exists(path)}
+        logging.info(f"Sweeping {len(self.keywords_dict)} keywords at "
+                     f"{len(self.thresholds)} thresholds over "
+                     f"{len(wav_paths)} recordings")
+        decodes = self.cached_decodes(wav_paths)
+        results = dict()
+        for keyword in self.keywords_dict:
+            results[keyword] = dict()
+            for threshold in self.thresholds:
+                expected = detected = true_positives = 0
+                audio_seconds = 0
+                for file_id, path in wav_paths.items():
+                    decode = decodes[self.decode_key(path, keyword, threshold)]
+                    if "error" in decode:
+                        continue
+                    count = count_phrase(transcriptions[file_id], keyword)
+                    expected += count
+                    detected += decode["detections"]
+                    true_positives += min(count, decode["detections"])
+                    audio_seconds += decode["audio_seconds"]
+                false_alarms = detected - true_positives
+                hours = audio_seconds / 3600
+                results[keyword][threshold] = {
+                    "threshold": threshold,
+                    "recall": true_positives / expected if expected else None,
+                    "false_alarms": false_alarms,
+                    "false_alarms_per_hour": (false_alarms / hours
+                                              if hours else 0)}
+        return results
+
+    def cached_decodes(self, wav_paths):
+        """Decodes every keyword, threshold and file not in the cache"""
+
+        self._wav_hashes = {path: self.sha256(path)
+                            for path in wav_paths.values()}
+        self._keyword_fingerprints = self.keyword_fingerprints()
+        decodes = dict()
+        tasks = []
+        for keyword in self.keywords_dict:
+            for threshold in self.thresholds:
+                kws_path, _ = language_dict.cached_keywords_paths(
+                    {keyword: threshold})
+                for path in wav_paths.values():
+                    key = self.decode_key(path, keyword, threshold)
+                    cached = self.read_cache(key)
+                    if cached is None:
+                        tasks.append((key, keyword, kws_path, path))
+                    else:
+                        decodes[key] = cached
+        self.cache_hits += len(decodes)
+        self.decodes += len(tasks)
+        if tasks:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with Pool(self.workers,
+                      initializer=_init_worker,
+                      initargs=(self.wrapper_kwargs,)) as pool:
+                for key, decode in pool.imap_unordered(_decode,
+                                                       tasks,
+                                                       chunksize=1):
+                    decodes[key] = decode
+                    if "error" not in decode:
+                        language_dict.atomic_write(self.cache_path(key),
+                                                   json.dumps(decode))
+        return decodes
+
+    def decode_key(self, wav_path, keyword, threshold):
+        key = [self._wav_hashes[wav_path],
+               self._keyword_fingerprints[keyword],
+               keyword,
+               threshold]
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()[:32]
+
+    def keyword_fingerprints(self):
+        """keyword -> hash of what decoding it alone depends on
+
+        Not the config's -kws, which covers every keyword, and not the
+        whole dict, which in compact mode changes with every keyword.
+        Only the keyword's own dict lines and the acoustic model's files"""
+
+        hmm = self.config.get_string("-hmm")
+        model = []
+        for fname in sorted(os.listdir(hmm)):
+            stat = os.stat(os.path.join(hmm, fname))
+            model.append([fname, stat.st_size, stat.st_mtime_ns])
+        words = {word for keyword in self.keywords_dict
+                 for word in keyword.lower().split()}
+        prons = language_dict.pronunciations(self.config.get_string("-dict"),
+                                             words)
+        fingerprints = dict()
+        for keyword in self.keywords_dict:
+            keyword_words = set(keyword.lower().split())
+            lines = sorted([entry, phones] for entry, phones in prons.items()
+                           if language_dict.base_word(entry) in keyword_words)
+            values = [model, lines]
+            fingerprints[keyword] = hashlib.sha256(
+                json.dumps(values).encode()).hexdigest()[:16]
+        return fingerprints
+
+    def read_cache(self, key):
+        try:
+            with open(self.cache_path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def cache_path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def pick(self, results):
+        """Best recall under the false alarm target, per keyword
+
+        Ties go to the strictest threshold. Keywords that never meet the
+        target get the threshold with the fewest false alarms"""
+
+        keywords_dict = dict()
+        report = dict()
+        for keyword, scores in results.items():
+            ok = [x for x in scores.values() if x["false_alarms_per_hour"]
+                  <= self.max_false_alarms_per_hour]
+            if ok:
+                best = max(ok, key=lambda x: (x["recall"] or 0,
+                                              x["threshold"]))
+            else:
+                logging.warning(f"No threshold for {keyword} meets "
+                                f"{self.max_false_alarms_per_hour} false "
+                                "alarms per hour")
+                best = min(scores.values(),
+                           key=lambda x: (x["false_alarms_per_hour"],
+                                          -(x["recall"] or 0)))
+            keywords_dict[keyword] = best["threshold"]
+            report[keyword] = dict(best, sweep=list(scores.values()))
+        return keywords_dict, report
+
+    @staticmethod
+    def sha256(path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
@@ -0,0 +1,136 @@
+from collections import deque
+from time import process_time
+
+import numpy as np
+
+from .audio_sources import Audio_Source
+
+# 10 ms frames, the same as the decoder's
+frame_samples = Audio_Source.sample_rate // 100
+
+
+def frame_levels(buf, frame_samples=frame_samples):
+    """Per frame energy in dBFS and zero crossing rate of int16 PCM"""
+
+    samples = np.frombuffer(buf, dtype=np.int16)
+    num_frames = len(samples) // frame_samples
+    if num_frames == 0:
+        return np.empty(0), np.empty(0)
+    frames = samples[:num_frames * frame_samples].reshape(num_frames, -1)
+    frames = frames.astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    energy_db = 20 * np.log10(rms / 32768 + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return energy_db, zcr
+
+
+class Energy_VAD:
+    """Energy and zero crossing gate in front of the decoder
+
+    A frame is speech if it's margin_db over the noise floor (and at
+    least threshold_db) with a zero crossing rate under max_zcr, or if
+    it's 10 dB louder than that, which keeps fricatives. The noise floor
+    is the quietest frame of the last floor_seconds, whether or not the
+    gate is open, so steady hum or fans don't hold it open. The gate
+    opens on min_speech_frames speech frames in a chunk, stays open for
+    hangover_seconds after the last one, and on opening also releases
+    the last pre_roll_seconds of audio so word onsets aren't clipped.
+    Windows are kept by the audio they hold, so they last as long
+    whatever chunk size the source reads"""
+
+    def __init__(self,
+                 threshold_db=-50,
+                 margin_db=12,
+                 max_zcr=0.35,
+                 min_speech_frames=3,
+                 hangover_seconds=0.5,
+                 pre_roll_seconds=0.3,
+                 floor_seconds=5):
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.max_zcr = max_zcr
+        self.min_speech_frames = min_speech_frames
+        self.hangover_samples = hangover_seconds * Audio_Source.sample_rate
+        self.pre_roll_samples = pre_roll_seconds * Audio_Source.sample_rate
+        self.pre_roll = deque()
+        self._pre_roll_held = 0
+        self.noise_floor_db = threshold_db
+        self.floor_samples = floor_seconds * Audio_Source.sample_rate
+        # (samples, quietest frame) of each recent chunk
+        self.chunk_floors = deque()
+        self._floor_held = 0
+        self.is_open = False
+        self._samples_since_speech = 0
+        # Metrics
+        self.total_samples = 0
+        self.fed_samples = 0
+        self.openings = 0
+        self.vad_seconds = 0
+
+    def is_speech(self, buf):
+        energy_db, zcr = frame_levels(buf)
+        if len(energy_db):
+            # Pauses between words keep this at the background level
+            num_samples = len(buf) // Audio_Source.sample_width
+            self.chunk_floors.append((num_samples, float(np.min(energy_db))))
+            self._floor_held += num_samples
+            while (self._floor_held - self.chunk_floors[0][0]
+                   >= self.floor_samples):
+                self._floor_held -= self.chunk_floors.popleft()[0]
+            self.noise_floor_db = min(x for _, x in self.chunk_floors)
+        threshold = max(self.threshold_db,
+                        self.noise_floor_db + self.margin_db)
+        speech = (((energy_db > threshold) & (zcr < self.max_zcr))
+                  | (energy_db > threshold + 10))
+        return int(np.count_nonzero(speech)) >= self.min_speech_frames
+
+    def process(self, buf):
+        """Returns the list of buffers to feed the decoder (often empty)"""
+
+        start = process_time()
+        num_samples = len(buf) // Audio_Source.sample_width
+        self.total_samples += num_samples
+        if self.is_speech(buf):
+            self._samples_since_speech = 0
+            if not self.is_open:
+                self.is_open = True
+                self.openings += 1
+                bufs = list(self.pre_roll) + [buf]
+                self.pre_roll.clear()
+                self._pre_roll_held = 0
+            else:
+                bufs = [buf]
+        elif self.is_open:
+            self._samples_since_speech += num_samples
+            if self._samples_since_speech > self.hangover_samples:
+                self.is_open = False
+            bufs = [buf]
+        else:
+            self.pre_roll.append(buf)
+            self._pre_roll_held += num_samples
+            # Whole chunks, as few as cover pre_roll_seconds
+            while (self._pre_roll_held - len(self.pre_roll[0])
+                   // Audio_Source.sample_width >= self.pre_roll_samples):
+                self._pre_roll_held -= (len(self.pre_roll.popleft())
+                                        // Audio_Source.sample_width)
+            bufs = []
+        self.fed_samples += sum(len(x) for x in bufs) // Audio_Source.sample_width
+        self.vad_seconds += process_time() - start
+        return bufs
+
+    def stats(self, decode_seconds=None):
+        """Fraction skipped, and the CPU it saved if decode_seconds
+        (CPU spent in process_raw) is given"""
+
+        skipped = self.total_samples - self.fed_samples
+        stats = {"openings": self.openings,
+                 "total_seconds": self.total_samples / Audio_Source.sample_rate,
+                 "skipped_fraction": (skipped / self.total_samples
+                                      if self.total_samples else 0),
+                 "vad_cpu_seconds": self.vad_seconds}
+        if decode_seconds is not None and self.fed_samples:
+            per_sample = decode_seconds / self.fed_samples
+            stats["decode_cpu_seconds"] = decode_seconds
+            stats["saved_cpu_seconds"] = skipped * per_sample - self.vad_seconds
+        return stats
@@ -0,0 +1,109 @@
+import logging
+import struct
+
+from .audio_sources import Audio_Source
+from .vad import Energy_VAD
+
+
+class Wav_Writer:
+    """Writes 16 kHz mono int16 PCM to a WAV file as it's captured
+
+    The header is written with placeholder sizes that get patched on
+    close, so memory stays the same however long the recording is.
+    With trim_silence, everything is written as it comes and on close
+    the audio from pad_seconds before the first speech to pad_seconds
+    after the last is moved to the front and the rest cut off. If no
+    speech was heard the file is kept untrimmed, since an empty WAV
+    breaks sphinx_fe and bw"""
+
+    header_size = 44
+    # Bytes moved at a time when trimming
+    move_size = 1 << 20
+
+    def __init__(self,
+                 path,
+                 trim_silence=False,
+                 pad_seconds=0.2):
+        self.path = path
+        self.f = open(path, "w+b")
+        self.f.write(self._header(0))
+        self.data_bytes = 0
+        self.vad = Energy_VAD() if trim_silence else None
+        self.pad_bytes = int(pad_seconds * Audio_Source.sample_rate) \
+            * Audio_Source.sample_width
+        self.heard_speech = False
+        # Data bytes written before the first speech and up to the last
+        self.speech_start = 0
+        self.speech_end = 0
+        # Metrics
+        self.captured_bytes = 0
+
+    def write(self, buf):
+        self.captured_bytes += len(buf)
+        if self.vad is not None and self.vad.is_speech(buf):
+            if not self.heard_speech:
+                self.heard_speech = True
+                self.speech_start = self.data_bytes
+            self.speech_end = self.data_bytes + len(buf)
+        self._write(buf)
+
+    def _write(self, buf):
+        self.f.write(buf)
+        self.data_bytes += len(buf)
+
+    def close(self):
+        if self.f.closed:
+            return
+        if self.vad is not None:
+            if self.heard_speech:
+                self.trim()
+            else:
+                logging.warning(f"No speech heard in {self.path}, "
+                                "keeping it untrimmed")
+        self.f.seek(0)
+        self.f.write(self._header(self.data_bytes))
+        self.f.close()
+
+    def trim(self):
+        start = max(0, self.speech_start - self.pad_bytes)
+        end = min(self.data_bytes, self.speech_end + self.pad_bytes)
+        # Moved front to back, so nothing is overwritten before it's read
+        for offset in range(0, end - start, self.move_size):
+            self.f.seek(self.header_size + start + offset)
+            buf = self.f.read(min(self.move_size, end - start - offset))
+            self.f.seek(self.header_size + offset)
+            self.f.write(buf)
+        self.data_bytes = end - start
+        self.f.truncate(self.header_size + self.data_bytes)
+
+    def _header(self, data_bytes):
+        byte_rate = (Audio_Source.sample_rate
+                     * Audio_Source.channels
+                     * Audio_Source.sample_width)
+        return struct.pack("<4sI4s4sIHHIIHH4sI",
+                           b"RIFF",
+                           36 + data_bytes,
+                           b"WAVE",
+                           b"fmt ",
+                           16,
+                           # PCM
+                           1,
+                           Audio_Source.channels,
+                           Audio_Source.sample_rate,
+                           byte_rate,
+                           Audio_Source.channels * Audio_Source.sample_width,
+                           Audio_Source.sample_width * 8,
+                           b"data",
+                           data_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def stats(self):
+        bytes_per_second = Audio_Source.sample_rate * Audio_Source.sample_width
+        return {"captured_seconds": self.captured_bytes / bytes_per_second,
+                "written_seconds": self.data_bytes / bytes_per_second}
@@ -12,6 +12,7 @@ setup(
     keywords=['Furuness', 'Assistant', 'voice', 'sphinx', 'voice assistant'],
     install_requires=[
         #'lib_utils',
+        'numpy',
         'pocketsphinx',
         'pyaudio',
     ],